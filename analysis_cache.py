@@ -0,0 +1,56 @@
+# On-disk cache of collated results and UQ analysis results of a campaign.
+#
+# The key is a hash of the results.csv files of all runs and of the analysis
+# configuration (sampler, varied parameters, orders, QoIs). Tables and plots can
+# then be made again from the cache, without collation and analysis.
+# Entries are pickled to <campaign_dir>/analysis_cache/<key>.pickle
+
+import os
+import json
+import pickle
+import hashlib
+import layout
+
+cache_subdir = 'analysis_cache'
+
+
+# campaign directory, from the EasyVVUQ state file, without loading the campaign database
+def campaign_dir(state_file, workdir):
+    with open(state_file) as f:
+        state = json.load(f)
+    return os.path.join(os.path.expanduser(workdir), state['campaign_dir'])
+
+
+def cache_key(campaign_dir, config, results_file='results.csv'):
+    h = hashlib.sha256()
+    h.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for d in layout.run_dirs(campaign_dir):
+        f = os.path.join(d, results_file)
+        if not os.path.exists(f):
+            continue
+        h.update(os.path.basename(d).encode())
+        with open(f, 'rb') as r:
+            h.update(hashlib.sha256(r.read()).digest())
+    return h.hexdigest()
+
+
+def entry(campaign_dir, key):
+    return os.path.join(campaign_dir, cache_subdir, key + '.pickle')
+
+
+# (data, results) for key, or None if not cached
+def load(campaign_dir, key):
+    try:
+        with open(entry(campaign_dir, key), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def save(campaign_dir, key, data, results):
+    filename = entry(campaign_dir, key)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    tmp = f'{filename}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        pickle.dump((data, results), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, filename)
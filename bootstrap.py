@@ -0,0 +1,99 @@
+# Bootstrap confidence intervals for moments and first-order Sobol indices.
+#
+# The runs are resampled with replacement, which for a weighted design
+# (e.g. the quadrature weights of an SC grid) amounts to multiplying the weights
+# with multinomial counts. All resamples, QoIs and parameters are evaluated
+# together as array operations, in chunks of resamples to bound the memory use.
+#
+# The first-order Sobol index of parameter i is estimated as
+#   S_i = Var(E[Y | X_i]) / Var(Y)
+# grouping the runs by the value of X_i. On a tensor grid with quadrature
+# weights this is the variance decomposition of the SC interpolant.
+
+import numpy
+import chaospy as cp
+
+
+# product quadrature weights for the runs of a tensor-grid SC campaign.
+# X: (runs, params) array of parameter values, dists: list of chaospy distributions
+def tensor_weights(X, dists, orders, rule="C"):
+    w = numpy.ones(len(X))
+    for i, (dist, order) in enumerate(zip(dists, orders)):
+        nodes, weights = cp.generate_quadrature(order, dist, rule=rule)
+        nodes = nodes[0]
+        # index of the 1D node of every run
+        k = numpy.abs(X[:, i, None] - nodes[None, :]).argmin(axis=1)
+        w *= weights[k]
+    return w / w.sum()
+
+
+# moments and first-order Sobol indices for a batch of weight vectors
+# W: (B, runs), rows summing to 1. Y: (runs, QoIs), X: (runs, params)
+# returns mean (B, Q), std (B, Q), sobols_first (B, Q, P)
+def weighted_stats(W, Y, X):
+    mean = W @ Y
+    var = W @ (Y * Y) - mean * mean
+    var = numpy.maximum(var, 0)
+
+    B, Q, P = W.shape[0], Y.shape[1], X.shape[1]
+    sobols = numpy.empty((B, Q, P))
+    for i in range(P):
+        levels, inverse = numpy.unique(X[:, i], return_inverse=True)
+        G = numpy.zeros((len(X), len(levels)))     # indicator of the level of each run
+        G[numpy.arange(len(X)), inverse] = 1
+        p = W @ G                                  # (B, K) weight of each level
+        S = (W @ (G[:, :, None] * Y[:, None, :]).reshape(len(X), -1)).reshape(B, len(levels), Q)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            cond_mean = numpy.where(p[:, :, None] > 0, S / p[:, :, None], 0)
+            var_i = numpy.sum(p[:, :, None] * (cond_mean - mean[:, None, :])**2, axis=1)
+            sobols[:, :, i] = numpy.where(var > 0, var_i / var, numpy.nan)
+    return mean, numpy.sqrt(var), sobols
+
+
+# bootstrap resamples of the statistics.
+# Y: (runs, QoIs), X: (runs, params), weights: (runs,) or None for equal weights
+def bootstrap(Y, X, weights=None, n_boot=2000, seed=None, chunk=500):
+    Y = numpy.asarray(Y, dtype=float)
+    X = numpy.asarray(X, dtype=float)
+    N = len(Y)
+    if weights is None:
+        weights = numpy.full(N, 1.0 / N)
+    rng = numpy.random.default_rng(seed)
+
+    means, stds, sobols = [], [], []
+    for start in range(0, n_boot, chunk):
+        counts = rng.multinomial(N, numpy.full(N, 1.0 / N), size=min(chunk, n_boot - start))
+        W = counts * weights
+        W /= W.sum(axis=1, keepdims=True)
+        m, s, S = weighted_stats(W, Y, X)
+        means.append(m)
+        stds.append(s)
+        sobols.append(S)
+    return {'mean': numpy.concatenate(means),
+            'std': numpy.concatenate(stds),
+            'sobols_first': numpy.concatenate(sobols)}
+
+
+# lower and upper bound of the central confidence interval, over the resamples (axis 0)
+def confidence_interval(samples, level=0.95):
+    q = 100 * (1 - level) / 2
+    return numpy.nanpercentile(samples, [q, 100 - q], axis=0)
+
+
+# bootstrap intervals in the structure of the EasyVVUQ analysis results:
+# ci[qoi]['mean'], ci[qoi]['std'], ci[qoi]['sobols_first'][param] = (low, high)
+# ci[qoi]['std_percent'] is the interval of the relative standard deviation, in %
+def bootstrap_intervals(data, qois, params, weights=None, n_boot=2000, level=0.95, seed=None):
+    boot = bootstrap(data[qois].values, data[params].values, weights, n_boot, seed)
+    mean = confidence_interval(boot['mean'], level)
+    std = confidence_interval(boot['std'], level)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        std_percent = confidence_interval(100 * boot['std'] / boot['mean'], level)
+    sobols = confidence_interval(boot['sobols_first'], level)
+    ci = {}
+    for j, qoi in enumerate(qois):
+        ci[qoi] = {'mean': tuple(mean[:, j]),
+                   'std': tuple(std[:, j]),
+                   'std_percent': tuple(std_percent[:, j]),
+                   'sobols_first': {v: tuple(sobols[:, j, i]) for i, v in enumerate(params)}}
+    return ci
@@ -0,0 +1,76 @@
+# Bulk collation of the results of a campaign.
+#
+# The EasyVVUQ collation element decodes the results file of each run with pandas,
+# one run at a time, grows the collated DataFrame run by run, and marks the runs
+# collated in chunks with a commit each. On large campaigns this dominates the
+# analysis. Here the results.csv files of all uncollated runs are read by a pool of
+# threads with the csv module, the DataFrame is built in one go, with the same columns
+# as AggregateSamples (QoIs, parameters, run_id, ensemble_id), appended to the
+# collation table in one write, and the runs are marked collated in one transaction.
+# This uses the internals of EasyVVUQ up to 0.6 (the campaign database and its run
+# table). When they are not there, e.g. in later versions, Campaign.collate() is used.
+
+import csv
+import concurrent.futures
+import numpy
+import pandas
+from easyvvuq import constants
+try:
+    from easyvvuq.db.sql import RunTable
+except ImportError:
+    RunTable = None
+
+# run names per query, below the SQLite limit of 999 parameters
+max_names = 900
+# missing values, as read by pandas. postproc.py writes None for a missing walltime
+missing = {'', 'None', 'NA', 'N/A', 'n/a', '#N/A', 'NULL', 'null'}
+
+
+# rows of the columns of a results file, None if the run has no results
+def read_results(filename, columns):
+    try:
+        with open(filename, newline='') as f:
+            rows = list(csv.DictReader(f))
+    except FileNotFoundError:
+        return None
+    return [[numpy.nan if row[c] in missing else float(row[c]) for c in columns] for row in rows]
+
+
+# mark the runs collated, in one transaction
+def set_collated(db, run_names):
+    for i in range(0, len(run_names), max_names):
+        db.session.query(RunTable).filter(RunTable.run_name.in_(run_names[i:i + max_names])).update(
+            {RunTable.status: constants.Status.COLLATED}, synchronize_session=False)
+    db.session.commit()
+
+
+# the EasyVVUQ internals used here are available
+def supported(campaign):
+    db = getattr(campaign, 'campaign_db', None)
+    return (RunTable is not None and hasattr(campaign, '_active_app') and
+            hasattr(db, 'append_collation_dataframe') and hasattr(db, 'session') and
+            hasattr(constants.Status, 'ENCODED') and hasattr(constants.Status, 'COLLATED'))
+
+
+# collate the results of the runs that are not collated yet, as Campaign.collate() does.
+# Returns the number of runs collated, None if Campaign.collate() was used
+def collate(campaign, filename, columns, workers=16):
+    if not supported(campaign):
+        print('Bulk collation is not supported by this EasyVVUQ version, using Campaign.collate()')
+        campaign.collate()
+        return None
+    db = campaign.campaign_db
+    app_id = campaign._active_app['id']
+    runs = list(db.runs(status=constants.Status.ENCODED, app_id=app_id))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda r: read_results(f"{r[1]['run_dir']}/{filename}", columns), runs))
+    collated = [(run_id, info, rows) for (run_id, info), rows in zip(runs, results) if rows]
+    if collated:
+        params = list(collated[0][1]['params'])
+        table = [row + [info['params'][p] for p in params] + [run_id, info['ensemble_name']]
+                 for run_id, info, rows in collated for row in rows]
+        db.append_collation_dataframe(pandas.DataFrame(table, columns=columns + params + ['run_id', 'ensemble_id']),
+                                      app_id)
+        set_collated(db, [run_id for run_id, info, rows in collated])
+    print(f'Collated {len(collated)} runs' + (f', {len(runs) - len(collated)} without results' if len(runs) > len(collated) else ''))
+    return len(collated)
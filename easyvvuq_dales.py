@@ -1,7 +1,13 @@
 import os
+import io
 import subprocess
 import argparse
 import sys
+import traceback
+import contextlib
+import threading
+import multiprocessing
+import concurrent.futures
 import easyvvuq as uq
 import chaospy as cp
 import matplotlib.pyplot as plt
@@ -10,6 +16,27 @@ from easyvvuq.encoders.jinja_encoder import JinjaEncoder
 import fabsim3_cmd_api as fab
 import numpy
 import numpy.random
+import pilot
+import runcheck
+import runcache
+import refine
+import bootstrap
+import analysis_cache
+import sobol
+import fidelity
+import qmc
+import gp
+import screen
+import tune
+import pinning
+import monitor
+import layout
+import namelist
+import pipeline
+import timeseries
+import collation
+import factorial
+from postproc import load_spec, qoi_columns
 
 # Analyzing DALES with EasyVVUQ
 # based on the EasyVVUQ gauss tutorial
@@ -28,31 +55,137 @@ postproc = "postproc.py" # post-processing script, run after DALES for each samp
 # Parameter handling 
 parser = argparse.ArgumentParser(description="EasyVVUQ for DALES",
                                  fromfile_prefix_chars='@')
+parser.add_argument("--tune",  action="store_true", default=False,
+                    help="Benchmark MPI decompositions and concurrent runs on this node, save the best to --tuning")
+parser.add_argument("--tuning", default=None,
+                    help="JSON file with the MPI decomposition and number of concurrent runs, written by --tune. "
+                    "Used by --prepare and --run")
+parser.add_argument("--tune_runtime", type=float, default=600,
+                    help="runtime of the --tune benchmark runs, in seconds")
 parser.add_argument("--prepare",  action="store_true", default=False,
                     help="Prepare run directories")
+parser.add_argument("--refine",  action="store_true", default=False,
+                    help="Raise the SC orders of an existing campaign to --orders, prepare only the new nodes. "
+                    "For the qmc and gp samplers, prepare the next batch of runs")
+parser.add_argument("--orders", default=None, type=str,
+                    help="comma-separated SC orders, one per varied parameter, overriding the experiment's orders")
+parser.add_argument("--shard",  action="store_true", default=False,
+                    help="with --prepare, put the run directories in shards of 100, runs/00/12/Run_1234")
+parser.add_argument("--pack",  action="store_true", default=False,
+                    help="after --analyze, pack the outputs of the finished runs into one archive per shard")
+parser.add_argument("--unpack",  action="store_true", default=False,
+                    help="extract packed outputs back into the run directories")
+parser.add_argument("--check",  action="store_true", default=False,
+                    help="Check the rendered namelists of the campaign before running: varied parameters used by the "
+                    "template, values within the parameter ranges, valid entries, nprocx x nprocy dividing itot x jtot. "
+                    "Stops if any run has problems")
 parser.add_argument("--run",  action="store_true", default=False,
                     help="Run model, sequentially")
+parser.add_argument("--pipeline",  action="store_true", default=False,
+                    help="Prepare, run and post-process the runs of the campaign as a pipeline on this node, then analyze. "
+                    "Runs start as soon as their directory is prepared, and are post-processed as soon as they complete, "
+                    "on the cores left free by --parallel concurrent runs. Use after --prepare or --refine")
 parser.add_argument("--parallel", type=int, default=0,
                     help="use parallel command to run model with N threads")
+parser.add_argument("--pin", action="store_true", default=False,
+                    help="with --run --parallel or --pipeline, pin each concurrent run to its own cores within one NUMA node. "
+                    "{cpus} in --mpirun is replaced by the core list, otherwise taskset is used")
+parser.add_argument("--monitor", type=float, default=0,
+                    help="during --run, print the progress of the runs every N seconds, and write it to progress.json "
+                    "in the campaign directory")
+parser.add_argument("--pilot", type=int, default=0,
+                    help="run model with N local pilot-job processes sharing a task list")
+parser.add_argument("--cores", type=int, default=os.cpu_count(),
+                    help="number of cores available to the pilot jobs")
+parser.add_argument("--walltime", type=float, default=None,
+                    help="walltime in seconds for the pilot jobs")
+parser.add_argument("--mpirun", default=pilot.default_mpirun,
+                    help="MPI launcher for pilot jobs, --tuning and --pin, {np} is replaced by nprocx*nprocy")
+parser.add_argument("--retries", type=int, default=2,
+                    help="number of times to retry a failed model run")
+parser.add_argument("--backoff", type=float, default=60,
+                    help="wait before retrying a failed run, in seconds. Doubled for every retry.")
+parser.add_argument("--cache", default=None,
+                    help="directory of a result cache shared between campaigns, reused for identical runs")
 parser.add_argument("--fab", action="store_true", default=False,
                     help="use Fabsim to run model")
 parser.add_argument("--fetch",  action="store_true", default=False,
                     help="Fetch fabsim results")
 parser.add_argument("--analyze",  action="store_true", default=False,
                     help="Analyze results")
-parser.add_argument("--sampler",  default="sc", choices=['sc', 'pce', 'random'],
-                    help="UQ sampling method, sc is the default.")
+parser.add_argument("--report",  action="store_true", default=False,
+                    help="Print tables and make plots from the cached results of an earlier --analyze")
+parser.add_argument("--sampler",  default="sc", choices=['sc', 'pce', 'random', 'mf', 'qmc', 'gp', 'factorial'],
+                    help="UQ sampling method, sc is the default. mf: random samples at two fidelity levels, "
+                    "qmc: batches of quasi-random samples for Saltelli Sobol estimates, "
+                    "gp: Gaussian-process emulator, with new samples chosen by --refine, "
+                    "factorial: all combinations of the discrete parameters, each with --replicas seeds, analyzed by ANOVA")
+parser.add_argument("--half_fraction",  action="store_true", default=False,
+                    help="factorial sampler: run a half fraction of the two-level factors, main effects only")
 parser.add_argument("--num_samples",  default="10", type=int,
-                    help="number of samples for the random sampler.")
+                    help="number of samples for the random and gp samplers, the number of low-fidelity samples for mf, "
+                    "the number of base points per batch for qmc (each takes number of parameters + 2 runs).")
+parser.add_argument("--qmc_rule",  default="sobol", choices=['sobol', 'halton'],
+                    help="low-discrepancy sequence for the qmc sampler")
+parser.add_argument("--tolerance",  default=0.05, type=float,
+                    help="qmc sampler: --refine adds batches until the half-width of the confidence intervals "
+                    "of the Sobol indices, and of the mean relative to the std, is below this. "
+                    "gp sampler: until the largest predictive std of the emulators, relative to the std of the QoI, is below this")
+parser.add_argument("--gp_batch",  default=8, type=int,
+                    help="number of runs added by --refine for the gp sampler")
+parser.add_argument("--gp_criterion",  default="variance", choices=['variance', 'integrated'],
+                    help="choice of new gp runs: largest predictive variance, or largest reduction of the integrated variance")
+parser.add_argument("--max_runs",  default=None, type=int,
+                    help="gp sampler: --refine adds no runs beyond this number")
+parser.add_argument("--num_fine",  default="5", type=int,
+                    help="number of samples also run at full fidelity, for the mf sampler.")
+parser.add_argument("--coarse_domain",  default="2", type=int,
+                    help="low-fidelity runs of the mf sampler: divide the horizontal domain by this factor, same grid spacing")
+parser.add_argument("--coarse_runtime",  default=None, type=float,
+                    help="low-fidelity runs of the mf sampler, and all runs of --experiment screen: runtime in seconds")
+parser.add_argument("--budget",  default=None, type=float,
+                    help="core-hours for the recommended split of fine and coarse runs of the mf sampler. "
+                    "By default the core-hours used by the current runs.")
 parser.add_argument("--order",  default="2", type=int,
                     help="Sampler order")
 parser.add_argument("--model",  default="dales4", help="Model executable file")
 parser.add_argument("--workdir", default="/tmp", help="Model working directory base")
 parser.add_argument("--template", default="namoptions.template", help="Template for model input file")
 parser.add_argument("--campaign", default="campaign_state.json", help="Campaign state file name")
-parser.add_argument("--replicas", default="1", type=int, help="Number of replicas")
-parser.add_argument("--experiment", default="physics", help="experiment setup - chooses set of parameters to vary")
+parser.add_argument("--replicas", default="1", type=int,
+                    help="Number of replicas. For the factorial sampler, the number of seeds per combination")
+parser.add_argument("--experiment", default="physics", help="experiment setup - chooses set of parameters to vary. "
+                    "screen: Morris screening of all parameters in the template, "
+                    "<file>.json: an experiment written by the screening analysis")
+parser.add_argument("--trajectories", default=10, type=int,
+                    help="number of Morris trajectories for --experiment screen, each takes number of parameters + 1 runs")
+parser.add_argument("--screen_threshold", default=0.1, type=float,
+                    help="screening: keep parameters whose effect is at least this fraction of the largest effect")
+parser.add_argument("--bootstrap", default=0, type=int,
+                    help="number of bootstrap resamples for confidence intervals in the analysis table")
+parser.add_argument("--confidence", default=0.95, type=float,
+                    help="confidence level of the bootstrap intervals")
+parser.add_argument("--bulk_collate", action="store_true", default=False,
+                    help="collate the results of all runs at once: the result files are read in parallel, "
+                    "and the campaign database is updated in one transaction")
+parser.add_argument("--analysis_workers", default=0, type=int,
+                    help="analyze the QoIs on the tensor grid in N worker processes, computing only the --sobols indices")
+parser.add_argument("--sobols", default="first",
+                    help="Sobol indices to compute with --analysis_workers, besides the first-order ones: total, all, "
+                    "and interactions as param1:param2, comma-separated")
+parser.add_argument("--time_resolved", action="store_true", default=False,
+                    help="with --analyze or --report, also compute the moments and first-order Sobol indices at every "
+                    "output time of tmser.001.nc, and plot them against time (sc and pce samplers)")
 parser.add_argument("--plot", default=None, type=str, help="File name for plot")
+parser.add_argument("--spec", action="append", default=None,
+                    help="campaign,template,experiment[,plot] to analyze. Can be repeated, "
+                    "the campaigns are then analyzed concurrently.")
+parser.add_argument("--reductions", default=None, type=str,
+                    help="JSON file with time windows and statistics for post-processing, see postproc.py")
+parser.add_argument("--postproc_memory", default=None, type=float,
+                    help="memory limit per post-processing worker in MB, the profiles are read in chunks")
+parser.add_argument("--postproc_workers", default=os.cpu_count(), type=int,
+                    help="number of post-processing workers for --analyze")
 
 args = parser.parse_args()
 template = os.path.abspath(args.template)
@@ -140,6 +273,48 @@ params = {
         "max": 2,
         "default": 2,
     },
+    "qmc_point": { # base point of a run of the qmc sampler. Not used in the template.
+        "type": "float",
+        "min": 0,
+        "max": 1e9,
+        "default": 0,
+    },
+    "qmc_matrix": { # 0 - A, 1..P - AB_i, P+1 - B for the qmc sampler. Not used in the template.
+        "type": "float",
+        "min": 0,
+        "max": 1000,
+        "default": 0,
+    },
+    "nprocx": { # MPI decomposition, set from the --tuning file
+        "type": "float",
+        "min": 1,
+        "max": 10000,
+        "default": 2,
+    },
+    "nprocy": {
+        "type": "float",
+        "min": 1,
+        "max": 10000,
+        "default": 8,
+    },
+    "morris_trajectory": { # trajectory of a run of --experiment screen. Not used in the template.
+        "type": "float",
+        "min": 0,
+        "max": 1e6,
+        "default": 0,
+    },
+    "morris_step": { # step along the trajectory of a run of --experiment screen. Not used in the template.
+        "type": "float",
+        "min": 0,
+        "max": 1000,
+        "default": 0,
+    },
+    "fidelity": { # 1 - full run, 0 - low-fidelity run of the mf sampler. Not used in the template.
+        "type": "float",
+        "min": 0,
+        "max": 1,
+        "default": 1,
+    },
 }
 
 # The following is a list of experiment definitions, one of which can be
@@ -195,11 +370,24 @@ experiment_options = {
     'subgrid'    : (vary_subgrid, (2,2,2,2)),      
 }
 
-vary, order = experiment_options[args.experiment]
-print('Parameters chosen for variation:', vary)
+# parameters to vary and SC orders of an experiment.
+# screen varies all parameters used in the template, a .json file is a screened experiment
+def experiment_setup(experiment, campaign, orders=None, template=template):
+    if experiment == 'screen':
+        vary = screen.distributions(params, screen.template_params(params, template))
+        return vary, (1,) * len(vary)
+    elif experiment.endswith('.json'):
+        vary, order = screen.load_experiment(experiment)
+    else:
+        vary, order = experiment_options[experiment]
+    order = refine.load_orders(campaign, order) # orders saved by an earlier --refine
+    if orders:
+        order = tuple(int(o) for o in orders.split(','))
+    return vary, order
 
-# list of model output quantities of interest (QoIs) to analyze
-output_columns = ['cfrac', 'lwp', 'rwp', 'zb', 'zi', 'prec', 'wq', 'wtheta', 'walltime']
+# list of model output quantities of interest (QoIs) to analyze, the columns of results.csv
+# written by postproc.py with the --reductions specification
+output_columns = [q for q in qoi_columns(load_spec(args.reductions)) if q != 'we'] + ['walltime']
 # omitted to save space: we
 
 # dictionary of units of the different quantities
@@ -232,6 +420,14 @@ scale={
     'z0'       : 1000      # convert m to mm
 }
 
+# the reduced QoIs <qoi>_<statistic>_<window> have the unit and scale of <qoi>
+for q in output_columns:
+    base = q.split('_')[0]
+    if base in unit:
+        unit.setdefault(q, unit[base])
+    if base in scale:
+        scale.setdefault(q, scale[base])
+
 plot_labels = {
     'wtheta'   : r'$w_{\theta}$',
     'wq'       : '$w_q$',
@@ -267,24 +463,70 @@ plot_labels = {
 #        order[i] = min(order[i],max_order)
 
 
-print(f'Orders: {order} (only for SC sampler)')
-    
 # 4. Specify Sampler
-if args.sampler=='sc':
-    # sc sampler can have differet orders for different dimensions
-    my_sampler = uq.sampling.SCSampler(vary=vary, polynomial_order=order,
-                                       quadrature_rule="C")
-elif args.sampler=='pce':
-    print('order argument',args.order)
-    my_sampler = uq.sampling.PCESampler(vary=vary, polynomial_order=args.order)
-                                        # quadrature_rule="G")
-elif args.sampler=='random':
-    my_sampler = uq.sampling.RandomSampler(vary=vary)
-else:
-    print("Unknown sampler specified", args.sampler)
-    sys.exit()
+def make_sampler(vary, order, experiment=None):
+    if (experiment or args.experiment)=='screen':
+        # the Morris trajectories are added with screen.design, the sampler is not drawn from
+        return uq.sampling.RandomSampler(vary=vary)
+    elif args.sampler=='sc':
+        # sc sampler can have differet orders for different dimensions
+        return uq.sampling.SCSampler(vary=vary, polynomial_order=order,
+                                     quadrature_rule="C")
+    elif args.sampler=='pce':
+        print('order argument',args.order)
+        return uq.sampling.PCESampler(vary=vary, polynomial_order=args.order)
+                                      # quadrature_rule="G")
+    elif args.sampler in ('random', 'mf', 'qmc', 'gp', 'factorial'):
+        # the mf, qmc and factorial runs are added with fidelity.design, qmc.batch and factorial.design,
+        # the sampler is not drawn from
+        return uq.sampling.RandomSampler(vary=vary)
+    else:
+        print("Unknown sampler specified", args.sampler)
+        sys.exit()
+
+# with --spec, the parameters and sampler of each campaign are set up by analyze()
+if args.spec and (args.prepare or args.refine or args.check or args.run or args.pipeline):
+    parser.error("--spec is for --analyze and --report only")
+# FabSim expects the run directories directly in runs/
+if args.fab and args.shard:
+    parser.error("--fab does not support --shard")
+# FabSim dispatches the whole campaign, the cache hits would be run again
+if args.fab and args.cache:
+    parser.error("--fab does not support --cache")
+if args.prepare:
+    # orders saved by --refine of an earlier campaign with the same state file name
+    refine.clear_orders(args.campaign)
+if not args.spec:
+    vary, order = experiment_setup(args.experiment, args.campaign, args.orders)
+    print('Parameters chosen for variation:', vary)
+    print(f'Orders: {order} (only for SC sampler)')
+    my_sampler = make_sampler(vary, order)
     
     
+if args.tune:
+    # short benchmark runs of the case with the default parameters, on this node
+    tuning = tune.tune(tune.render(template, params), cwd+'/input',
+                       f"{args.mpirun} {args.model} {input_filename}", args.cores, args.tune_runtime,
+                       os.path.join(os.path.expanduser(args.workdir), 'tune'))
+    args.tuning = args.tuning or 'tuning.json'
+    tune.save(args.tuning, tuning)
+    print(f"Tuning: nprocx {tuning['nprocx']}, nprocy {tuning['nprocy']}, {tuning['parallel']} concurrent runs,"
+          f" saved to {args.tuning}")
+
+if args.tuning:
+    # the decomposition is rendered into the namelists by the template
+    tuning = tune.load(args.tuning)
+    params['nprocx']['default'] = tuning['nprocx']
+    params['nprocy']['default'] = tuning['nprocy']
+
+# collate the results of the runs not collated yet, in bulk with --bulk_collate
+def collate(my_campaign):
+    if args.bulk_collate and use_csv_decoder:
+        collation.collate(my_campaign, out_file, output_columns)
+    else:
+        my_campaign.collate()
+
+
 if args.prepare:
     # 1. Create campaign
     my_campaign = uq.Campaign(name='dales',  work_dir=args.workdir)
@@ -318,48 +560,201 @@ if args.prepare:
 
     my_campaign.set_sampler(my_sampler)
 
-    if args.experiment=='choices':
+    if args.experiment=='choices' and args.sampler != 'factorial':
         my_campaign.verify_all_runs = False
         # work-around to prevent validation errors on integer quantities
         # needed when *all* quantities varied are discrete
     
     # 5. Get run parameters
-    if args.sampler=='random':
+    if args.experiment=='screen':
+        my_campaign.add_runs(screen.design(params, list(vary), args.trajectories))
+    elif args.sampler=='random' or args.sampler=='gp':
         my_campaign.draw_samples(num_samples=args.num_samples, replicas=args.replicas)
+    elif args.sampler=='mf':
+        # num_samples low-fidelity points, the first num_fine of them also at full fidelity
+        my_campaign.add_runs(fidelity.design(vary, args.num_samples, args.num_fine))
+    elif args.sampler=='qmc':
+        # first batch of the sequence, later batches are added with --refine
+        qmc_state = {'rule': args.qmc_rule, 'seed': int(numpy.random.randint(2**31)),
+                     'batch_size': args.num_samples, 'points': args.num_samples, 'converged': False}
+        my_campaign.add_runs(qmc.batch(vary, 0, args.num_samples, args.qmc_rule, qmc_state['seed']))
+        qmc.save_state(args.campaign, qmc_state)
+    elif args.sampler=='factorial':
+        # every combination of the discrete parameters, with the same --replicas seeds
+        my_campaign.add_runs(factorial.design(vary, args.replicas, args.half_fraction))
     else:
         my_campaign.draw_samples(replicas=args.replicas)
 
     # 6. Create run input directories
     my_campaign.populate_runs_dir()
+    if args.shard:
+        layout.shard_campaign(my_campaign)
 
     print(my_campaign)
 
     # run pre-processing script for each run directory
     # used to copy input files that are common to each run
-    prep_script=f"prep.sh {cwd+'/input'}"
-    my_campaign.apply_for_each_run_dir(uq.actions.ExecuteLocal(prep_script))
+    if not args.pipeline:   # the pipeline prepares each run just before it is started
+        prep_script=f"prep.sh {cwd+'/input'}"
+        my_campaign.apply_for_each_run_dir(uq.actions.ExecuteLocal(prep_script))
+
+    if args.experiment=='screen' and args.coarse_runtime:
+        # shorter screening runs
+        for run_id, info in my_campaign.list_runs():
+            fidelity.coarsen(info['run_dir'], 1, args.coarse_runtime)
+
+    if args.sampler=='mf':
+        # make the low-fidelity runs smaller and/or shorter, by editing their namelists
+        for run_id, info in my_campaign.list_runs():
+            if info['params']['fidelity'] == 0:
+                fidelity.coarsen(info['run_dir'], args.coarse_domain, args.coarse_runtime)
     
     my_campaign.save_state(args.campaign)
 
+if args.refine:
+    my_campaign = uq.Campaign(state_file=args.campaign, work_dir=args.workdir)
+    if args.sampler == 'qmc':
+        # the next batch of the sequence, unless the last --analyze met the tolerance
+        qmc_state = qmc.load_state(args.campaign)
+        if qmc_state['converged']:
+            print('QMC: tolerance met in the last analysis, no new runs')
+            new_runs = []
+        else:
+            new_runs = qmc.batch(vary, qmc_state['points'], qmc_state['batch_size'],
+                                 qmc_state['rule'], qmc_state['seed'])
+            qmc_state['points'] += qmc_state['batch_size']
+            print(f"QMC: adding {len(new_runs)} runs, {qmc_state['points']} base points")
+    elif args.sampler == 'gp':
+        # fit the emulators to the runs so far, and choose where to run next.
+        # needs the results of all runs, post-processed by --analyze
+        collate(my_campaign)
+        data = my_campaign.get_collation_result()
+        n_runs = len(list(my_campaign.list_runs()))
+        n = args.gp_batch if args.max_runs is None else min(args.gp_batch, args.max_runs - n_runs)
+        if len(data) < n_runs:
+            print(f'GP: {n_runs - len(data)} runs have no results yet. Use --run and --analyze first.')
+            new_runs = []
+        elif n <= 0:
+            print(f'GP: --max_runs {args.max_runs} reached, no new runs')
+            new_runs = []
+        else:
+            new_runs = gp.next_batch(data, output_columns[:-1], vary, n, args.gp_criterion, args.tolerance)
+            print(f'GP: adding {len(new_runs)} runs' if new_runs else f'GP: tolerance {args.tolerance} met, no new runs')
+    else:
+        # add the nodes of the higher-order sampler that are not yet run.
+        # with the nested Clenshaw-Curtis rule, the old nodes are a subset of the new ones
+        # when each order is doubled, or stays the same.
+        runs = [info['params'] for run_id, info in my_campaign.list_runs()]
+        new_runs = refine.new_nodes(my_sampler, runs, list(vary))
+    my_campaign.set_sampler(my_sampler)
+    if new_runs:
+        my_campaign.add_runs(new_runs)
+        my_campaign.populate_runs_dir()
+        if layout.is_sharded(my_campaign.campaign_dir):
+            layout.shard_campaign(my_campaign)
+        if not args.pipeline:
+            prep_script=f"prep.sh {cwd+'/input'}"
+            my_campaign.apply_for_each_run_dir(uq.actions.ExecuteLocal(prep_script))
+    if args.sampler == 'qmc':
+        qmc.save_state(args.campaign, qmc_state)
+    elif args.sampler != 'gp':
+        refine.save_orders(args.campaign, order)
+    my_campaign.save_state(args.campaign)
+
 ################################################
 
+if args.check:
+    # pre-flight check of the rendered namelists, before core-hours are spent on them
+    my_campaign = uq.Campaign(state_file=args.campaign, work_dir=args.workdir)
+    runs = list(my_campaign.list_runs())
+    failed, template_problems = namelist.check_campaign(runs, template, vary, params)
+    namelist.print_report(failed, template_problems, len(runs))
+    if failed or template_problems:
+        sys.exit(1)
+
+# the model is run through runcheck.py, which checks the outputs,
+# retries failed runs and skips runs that already completed.
+# with --tuning, it is launched with --mpirun and the tuned number of tasks,
+# otherwise with --mpirun and tasks if given (for --pin)
+def model_command(tasks=None):
+    if args.tuning:
+        tasks = tuning['nprocx'] * tuning['nprocy']
+    if tasks:
+        mpirun = args.mpirun.replace('{np}', str(tasks))
+        return runcheck.wrap_command(f"{mpirun} {args.model} {input_filename}", args.retries, args.backoff)
+    return runcheck.wrap_command(f"{args.model} {input_filename}", args.retries, args.backoff)
+
+
+# the model command started by pinning.py on the cores of a job slot
+def pinned_command(model_cmd, slot, slots, tasks):
+    return f"python3 {cwd}/pinning.py --slot {slot} --slots {slots} --tasks {tasks} -- {model_cmd}"
+
+
 if args.run:
     # 7. Run Application
     #    - dales is executed for each sample
     
     my_campaign = uq.Campaign(state_file=args.campaign, work_dir=args.workdir)
+    if args.fab and layout.is_sharded(my_campaign.campaign_dir):
+        sys.exit(f"{my_campaign.campaign_dir} is sharded, --fab needs the run directories in runs/")
+
+    model_cmd = model_command()
+    if args.tuning and not (args.parallel or args.pilot or args.fab):
+        # as many concurrent runs as benchmarked
+        args.parallel = tuning['parallel']
+    if args.pin and not args.parallel:
+        # the sequential, pilot and FabSim runs have no job slots to pin
+        sys.exit("--pin needs --parallel (or --tuning) with --run, or --pipeline")
 
+    if args.cache:
+        # link results of identical earlier runs, from any campaign, instead of running them
+        cache = runcache.RunCache(args.cache, cwd+'/input', args.model)
+        runcache.fetch_campaign(cache, my_campaign.campaign_dir)
+
+    if args.monitor:
+        # progress of the runs, in the background
+        runs_done = threading.Event()
+        watcher = threading.Thread(target=monitor.monitor, args=(my_campaign.campaign_dir, args.monitor),
+                                   kwargs={'stop': runs_done.is_set}, daemon=True)
+        watcher.start()
 
     if args.parallel:
         # run with gnu parallel, in parallel on the local machine
-        pcmd = f"ls -d {my_campaign.campaign_dir}/runs/Run_* | parallel -j {args.parallel} 'cd {{}} ; {args.model} namoptions.001 > output.txt ;  cd .. '"
+        run_cmd = model_cmd
+        if args.pin:
+            # each job slot {%} gets its own cores, for the largest run of the campaign
+            tasks = max(pilot.mpi_tasks(d) for d in runcheck.run_dirs(my_campaign.campaign_dir))
+            run_cmd = pinned_command(model_command(tasks), '{%}', args.parallel, tasks)
+        # the run directories are given on stdin, in either layout
+        pcmd = f"parallel -j {args.parallel} 'cd {{}} ; {run_cmd} ;  cd .. '"
         print ('Parallel run command', pcmd)
-        subprocess.call(pcmd, shell=True)
+        subprocess.run(pcmd, shell=True, text=True,
+                       input='\n'.join(runcheck.run_dirs(my_campaign.campaign_dir)) + '\n')
+        if args.pin:
+            pinning.print_placement(my_campaign.campaign_dir)
+    elif args.pilot:
+        # pilot-job mode, locally: N pilot processes pull run directories from
+        # a shared task list. Unfinished runs stay on the list for the next --run.
+        pilot.create_tasks(my_campaign.campaign_dir, requeue=True)
+        tasks = pilot.run_local(my_campaign.campaign_dir,
+                                pilot.model_command(args.model, args.mpirun, args.retries, args.backoff),
+                                args.pilot, args.cores, args.walltime)
+        print('Pilot tasks:', tasks)
     elif args.fab: # run with FabSim
         fab.run_uq_ensemble(my_campaign.campaign_dir, script_name='dales', machine='eagle_vecma')
     else:
         # run sequentially
-        my_campaign.apply_for_each_run_dir(uq.actions.ExecuteLocal(f"{args.model} namoptions.001 > output.txt"))
+        my_campaign.apply_for_each_run_dir(uq.actions.ExecuteLocal(model_cmd))
+
+    if args.monitor:
+        runs_done.set()
+        watcher.join()
+        monitor.monitor(my_campaign.campaign_dir, once=True, quiet=True)   # final state in progress.json
+
+    if not args.fab:
+        runcheck.print_summary(runcheck.write_status_table(my_campaign.campaign_dir))
+        if args.cache:
+            runcache.store_campaign(cache, my_campaign.campaign_dir)
         
     my_campaign.save_state(args.campaign)
 
@@ -368,47 +763,181 @@ if args.run:
 if args.fetch:    
     my_campaign = uq.Campaign(state_file=args.campaign, work_dir=args.workdir)
     if args.fab:
+        if layout.is_sharded(my_campaign.campaign_dir):
+            sys.exit(f"{my_campaign.campaign_dir} is sharded, --fab needs the run directories in runs/")
         print("Fetching results with FabSim:")
         fab.get_uq_samples(my_campaign.campaign_dir, machine='eagle_vecma')
+        runcheck.print_summary(runcheck.write_status_table(my_campaign.campaign_dir))
     my_campaign.save_state(args.campaign)
                 
-if args.analyze:
-    my_campaign = uq.Campaign(state_file=args.campaign, work_dir=args.workdir)
-    my_campaign.apply_for_each_run_dir(uq.actions.ExecuteLocal(postproc, interpret='python3'))
+# check the run status table of a campaign, runs without status are checked here
+def check_runs(campaign_dir):
+    run_status = runcheck.write_status_table(campaign_dir)
+    runcheck.print_summary(run_status)
+    failed = runcheck.failed_runs(run_status)
+    if failed:
+        print(f"{campaign_dir}: {len(failed)} runs failed, analysis needs all runs. Use --run again to retry them.")
+    return not failed
+
+
+def postproc_command(reductions=None, max_memory=None):
+    cmd = ['python3', os.path.join(cwd, postproc)]
+    if reductions:
+        cmd.append(os.path.abspath(reductions))
+    if max_memory:
+        cmd += ['--max_memory', str(max_memory)]
+    return cmd
+
+
+# run the post-processing script in a run directory, with its output in postproc.txt
+def postprocess_run(d, cmd):
+    with open(os.path.join(d, 'postproc.txt'), 'wb') as out:
+        return subprocess.call(cmd, cwd=d, stdout=out, stderr=subprocess.STDOUT)
+
+
+# run the post-processing script in each run directory, with a pool of workers.
+# the output of the script is saved in postproc.txt in the run directory.
+# packed runs keep their results, they are not post-processed again.
+def postprocess(run_dirs, workers, reductions=None, max_memory=None):
+    packed = [d for d in run_dirs if layout.is_packed(d)]
+    if packed:
+        print(f'{len(packed)} packed runs are not post-processed again, use --unpack to include them')
+        packed = set(packed)
+        run_dirs = [d for d in run_dirs if d not in packed]
+    cmd = postproc_command(reductions, max_memory)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        codes = list(pool.map(lambda d: postprocess_run(d, cmd), run_dirs))
+    for d, c in zip(run_dirs, codes):
+        if c:
+            print(f'Post-processing failed in {d}, see postproc.txt')
+    print(f'Post-processed {len(run_dirs)} runs with {workers} workers')
+
+
+# rank the parameters of a screening campaign, and write the recommended experiment
+def screen_report(campaign, data, names):
+    qois = output_columns[:-1]   # not walltime
+    mu_star, sigma, score = screen.statistics(data, qois, params, names)
+    print('         --- Morris screening, mu* / std(QoI) ---')
+    print('%10s %6s %6s' % ('param', 'score', 'sigma') + ''.join('%9s' % q for q in qois))
+    spread = numpy.nanmax(sigma / data[qois].values.std(axis=0)[:, None], axis=0)   # non-linearity, interactions
+    for i in numpy.argsort(-score):
+        print('%10s %6.3f %6.3f' % (names[i], score[i], spread[i]) +
+              ''.join('%9.3f' % (mu_star[j, i] / data[q].std()) for j, q in enumerate(qois)))
+    chosen = screen.recommend(params, names, score, args.screen_threshold)
+    filename = os.path.splitext(campaign)[0] + '.screened.json'
+    screen.save_experiment(filename, params, chosen)
+    print('Recommended parameters and SC orders:', ', '.join(f'{p}: {o}' for p, o in chosen))
+    print(f'Written to {filename}, use it with --experiment {filename}')
+
+
+# collate the results of a campaign and apply the UQ analysis
+def collate_and_analyze(campaign, vary, order, sampler, experiment=None):
+    my_campaign = uq.Campaign(state_file=campaign, work_dir=args.workdir)
 
     # 8. Collate output
-    my_campaign.collate()
+    collate(my_campaign)
     # to re-run all collation, use my_campaign.recollate()
     
     data = my_campaign.get_collation_result()
     print(data)
+    missing = [q for q in output_columns if q not in data]
+    if missing:
+        print(f"{campaign}: QoIs {' '.join(missing)} are not collated. "
+              "Give the same --reductions to --prepare and --analyze.")
+        sys.exit(1)
     
     # 9. Run Analysis
+    if experiment == 'screen':
+        screen_report(campaign, data, list(vary))
+        return data, None
+
     if args.sampler == 'random':
         analysis = uq.analysis.BasicStats(qoi_cols=output_columns)
         my_campaign.apply_analysis(analysis)
         print("stats:\n", my_campaign.get_last_analysis())
-        sys.exit()
+        return data, None
+
+    if args.sampler == 'mf':
+        # control-variate estimates from the paired fine and coarse runs
+        results = fidelity.analyse(data, output_columns, list(vary))
+        # cost of a run in core-seconds: walltime times the number of MPI tasks of its level
+        tasks = {}
+        for run_id, info in my_campaign.list_runs():
+            tasks.setdefault(info['params']['fidelity'], pilot.mpi_tasks(info['run_dir']))
+        budget = args.budget * 3600 if args.budget else None
+        for qoi in output_columns[:-1]:
+            p = fidelity.plan(data, qoi, list(vary), budget, tasks=(tasks.get(1, 1), tasks.get(0, 1)))
+            print("%8s rho %6.3f  cost fine/coarse %8.3g  recommended fine %5d coarse %6d  variance reduction %5.2f"%(
+                qoi, p['rho'], p['cost_fine'] / p['cost_coarse'], p['n_fine'], p['n_coarse'], p['gain']))
+        return data, results
+
+    if args.sampler == 'factorial':
+        return data, factorial.analyse(data, output_columns, vary, args.half_fraction)
+
+    if args.sampler == 'qmc':
+        return data, qmc.analyse(data, output_columns, vary, args.bootstrap or 500, args.confidence)
+
+    if args.sampler == 'gp':
+        # moments and Sobol indices of the emulators
+        results = gp.analyse(data, output_columns, vary)
+        print('GP: largest relative predictive std',
+              ' '.join(f"{q}: {results['error'][q]:.3f}" for q in output_columns))
+        return data, results
+
+    if args.sampler == 'sc' and refine.is_refined(campaign):
+        # runs of a refined campaign are not in the sampler's node order, and may include runs
+        # of earlier orders that are not nodes now. Only the nodes are analysed, and reported.
+        data = refine.sort_to_nodes(data, sampler, list(vary))
+
+    if args.analysis_workers:
+        # our own analysis on the tensor grid, split over worker processes
+        rule, orders = ("C", order) if args.sampler == 'sc' else ("G", [args.order] * len(vary))
+        weights = bootstrap.tensor_weights(data[list(vary)].values, list(vary.values()), orders, rule=rule)
+        requested = sobol.parse_requested(args.sobols, vary)
+        return data, sobol.analyse(data, output_columns, vary, weights, requested, args.analysis_workers)
 
     if args.sampler == 'sc':
-        analysis = uq.analysis.SCAnalysis(sampler=my_sampler, qoi_cols=output_columns)
+        analysis = uq.analysis.SCAnalysis(sampler=sampler, qoi_cols=output_columns)
     elif args.sampler == 'pce':
-        analysis = uq.analysis.PCEAnalysis(sampler=my_sampler, qoi_cols=output_columns)    
+        analysis = uq.analysis.PCEAnalysis(sampler=sampler, qoi_cols=output_columns)    
 
     # perform analysis with EasyVVUQ
-    my_campaign.apply_analysis(analysis)
-    results = my_campaign.get_last_analysis()
+    if args.sampler == 'sc' and refine.is_refined(campaign):
+        results = analysis.analyse(data)   # sorted to the nodes above
+    else:
+        my_campaign.apply_analysis(analysis)
+        results = my_campaign.get_last_analysis()
+    return data, results
 
-    # from here on, it's reporting and plotting
 
+# names of the parameters we vary, in the order used in tables and plots
+def ordered_params(vary):
     var = list(vary.keys()) # names of the parameters we vary
     if 'seed' in var:
         # put 'seed' last for consistency
         # cannot change the vary dict after the runs are already done (EasyVVUQ issue?)
         var.remove('seed')
         var.append('seed')
-    
-    print(f"sampler: {args.sampler}, order: {args.order}")
+    return var
+
+
+# print tables of the moments and Sobol indices
+def report(data, results, vary, order, var):
+    ci = None
+    if args.sampler == 'qmc':
+        ci = results['intervals']   # from resampling the base points
+    elif args.bootstrap and args.sampler in ('sc', 'pce'):
+        # resample the runs, using the quadrature weights of the grid
+        if args.sampler == 'sc':
+            weights = bootstrap.tensor_weights(data[var].values, [vary[v] for v in var],
+                                               [order[list(vary).index(v)] for v in var], rule="C")
+        else:
+            weights = bootstrap.tensor_weights(data[var].values, [vary[v] for v in var],
+                                               [args.order] * len(var), rule="G")
+        ci = bootstrap.bootstrap_intervals(data, output_columns, var, weights,
+                                           args.bootstrap, args.confidence)
+
+    print(f"sampler: {args.sampler}, order: {args.order if args.sampler == 'pce' else order}")
     print('         --- Varied input parameters ---')
     print("  param    default      unit     distribution")
     for k in var:
@@ -441,6 +970,13 @@ if args.analyze:
     print(end)
     if latex:
         print(r'\hline')
+
+    # format a bootstrap confidence interval, for appending to a table entry
+    def fmt_ci(interval, fmt, factor=1):
+        if ci is None:
+            return ''
+        lo, hi = interval
+        return f" [{fmt%(lo*factor)},{fmt%(hi*factor)}]"
     
     for qoi in output_columns:
         if latex:
@@ -449,22 +985,28 @@ if args.analyze:
             q = qoi
             
         print("%12s"%q, end=sep)
-        print("% 6.3g %9s%s% 6.1f"%(results['statistical_moments'][qoi]['mean'] * scale.get(qoi,1), unit[qoi], sep,
+        print("% 6.3g%s %9s%s% 6.1f%s"%(results['statistical_moments'][qoi]['mean'] * scale.get(qoi,1),
+                                       fmt_ci(ci and ci[qoi]['mean'], '%.3g', scale.get(qoi,1)), unit[qoi], sep,
                        #% 6.3g%s             # results['statistical_moments'][qoi]['std'] * scale.get(qoi,1), sep, # st.dev.
-                                               100*results['statistical_moments'][qoi]['std']/results['statistical_moments'][qoi]['mean']),
+                                               100*results['statistical_moments'][qoi]['std']/results['statistical_moments'][qoi]['mean'],
+                                       fmt_ci(ci and ci[qoi]['std_percent'], '%.1f')),
               end='')
         #print("%9s"%unit[qoi], end='')
         for v in var:
-            print('%s %5.3f'%(sep, results['sobols_first'][qoi][v]), end='')
+            print('%s %5.3f%s'%(sep, results['sobols_first'][qoi][v],
+                                fmt_ci(ci and ci[qoi]['sobols_first'][v], '%.2f')), end='')
         print(end)
 
     if latex:
         print(r'\hline')
         print(r'\end{tabular}')
+    if ci:
+        print(f"bootstrap: {args.bootstrap or 500} resamples, {100*args.confidence:g}% confidence intervals in brackets")
     print()
     
     # print multi-variable Sobol indices
-    if args.sampler == 'sc':  # multi-var Sobol indices are not available for PCE
+    # multi-var Sobol indices are not available for PCE, except with --analysis_workers
+    if args.sampler == 'sc' or args.analysis_workers:
         for qoi in output_columns: 
             print(qoi, end=' ')
                   #results['statistical_moments'][qoi]['mean'][0], 
@@ -474,10 +1016,44 @@ if args.analyze:
                 if len(k) > 1: # print only the combined indices
                     print(f"{k}: {sobols[k][0]:5.3f}", end=' ')
             print()
+    if results.get('sobols_total'):  # total Sobol indices, qmc, gp, or requested with --sobols
+        for qoi in output_columns:
+            print(qoi, 'total', ' '.join(f"{v}: {results['sobols_total'][qoi][v]:5.3f}" for v in var))
+    if args.sampler == 'factorial':
+        anova_report(results)
 
-        
-    # print(my_campaign.get_collation_result()) # a Pandas dataframe
-    
+
+# ANOVA table of a factorial campaign: fraction of the variance, F and p of each effect
+def anova_report(results):
+    a, factors = results['anova'], results['factors']
+    names = {u: ':'.join(factors[i] for i in u) for u in a['effects']}
+    print('         --- ANOVA, fraction of the variance (F, p) ---')
+    print('%10s %4s' % ('effect', 'df') + ''.join('%22s' % q for q in output_columns))
+    for u, e in a['effects'].items():
+        print('%10s %4d' % (names[u], e['df']) +
+              ''.join('%7.3f (%6.1f, %.0e)' % (e['fraction'][j], e['F'][j], e['p'][j]) for j in range(len(output_columns))))
+    r = a['residual']
+    print('%10s %4d' % ('residual', r['df']) + ''.join('%7.3f %14s' % (f, '') for f in r['fraction']))
+    if r['df'] == 0:
+        print('No residual degrees of freedom, use --replicas 2 or more for the F tests')
+
+
+# convergence of a qmc campaign, saved for the next --refine
+def qmc_status(campaign, results):
+    remaining = qmc.unconverged(results, args.tolerance, output_columns[:-1])  # not walltime
+    qmc_state = qmc.load_state(campaign)
+    qmc_state['converged'] = not remaining
+    qmc.save_state(campaign, qmc_state)
+    print(f"QMC: {results['points']} base points, errors",
+          ' '.join(f"{q}: {results['error'][q]:.3f}" for q in output_columns[:-1]))
+    if remaining:
+        print(f"QMC: tolerance {args.tolerance} not met for {', '.join(remaining)}. Use --refine, --run and --analyze again.")
+    else:
+        print(f"QMC: tolerance {args.tolerance} met")
+
+
+# plot every QoI against every varied parameter
+def make_plot(data, var, plot):
     mplparams = {"figure.figsize" : [5.31, 5],  # figure size in inches
                  "figure.dpi"     :  200,      # figure dots per inch
                  "font.size"      :  6,        # this one acutally changes tick labels
@@ -567,7 +1143,200 @@ if args.analyze:
     plt.subplots_adjust(left=.1, top=.99, bottom=.1, right=.99, wspace=0, hspace=0)
     fig.patch.set_visible(False) # remove background rectangle?
 
-    if args.plot:
-        print('Saving plot as', args.plot)
-        plt.savefig(args.plot)
+    if plot:
+        print('Saving plot as', plot)
+        plt.savefig(plot)
     #plt.show()
+
+
+# the settings the analysis results depend on, part of the analysis cache key
+def analysis_config(campaign, vary, order):
+    return {'sampler': args.sampler,
+            'vary': {k: str(v) for k, v in vary.items()},
+            'order': order if args.sampler == 'sc' else args.order,
+            'coarse': (args.coarse_domain, args.coarse_runtime) if args.sampler == 'mf' else None,
+            'half_fraction': args.half_fraction if args.sampler == 'factorial' else None,
+            'refined': refine.is_refined(campaign),
+            'qois': output_columns,
+            'sobols': args.sobols if args.analysis_workers else 'easyvvuq',
+            'bootstrap': (args.bootstrap, args.confidence) if args.sampler == 'qmc' else None}
+
+
+# moments and first-order Sobol indices at every output time of the time series, on the tensor grid.
+# The results are kept in the campaign directory, --report reuses them.
+def time_resolved(campaign, vary, order, plot=None, report_only=False):
+    if args.sampler not in ('sc', 'pce'):
+        print('The time-resolved analysis needs the tensor grid of the sc or pce sampler')
+        return
+    filename = os.path.join(analysis_cache.campaign_dir(campaign, args.workdir), timeseries.results_file)
+    if report_only and os.path.exists(filename):
+        results = timeseries.load_results(filename)
+    else:
+        my_campaign = uq.Campaign(state_file=campaign, work_dir=args.workdir)
+        runs = list(my_campaign.list_runs())
+        X = numpy.array([[info['params'][p] for p in vary] for run_id, info in runs], dtype=float)
+        if args.sampler == 'sc' and refine.is_refined(campaign):
+            # only the runs at the nodes of the current orders
+            index = refine.node_index(make_sampler(vary, order), X)
+            runs, X = [runs[i] for i in index], X[index]
+        rule, orders = ("C", order) if args.sampler == 'sc' else ("G", [args.order] * len(vary))
+        weights = bootstrap.tensor_weights(X, list(vary.values()), orders, rule=rule)
+        t, Y = timeseries.load([info['run_dir'] for run_id, info in runs])
+        results = timeseries.analyse(t, Y, X, weights, list(timeseries.default_spec['timeseries']), list(vary))
+        timeseries.save(filename, results)
+
+    print('         --- first-order Sobol indices against time ---')
+    var = list(results['params'])
+    rows = numpy.unique(numpy.linspace(0, len(results['time']) - 1, 7).astype(int))
+    for j, qoi in enumerate(results['qois']):
+        print('%8s %8s' % (qoi, 'time(h)') + ''.join('%10s' % v for v in var))
+        for k in rows:
+            print('%8s %8.2f' % ('', results['time'][k] / 3600) + ''.join('%10.3f' % S for S in results['first'][k, j]))
+    base, ext = os.path.splitext(plot) if plot else ('time_resolved', '.png')
+    timeseries.plot(results, base + '_time' + ext if plot else base + ext, plot_labels, scale)
+
+
+# full analysis of one campaign: collation, UQ analysis, table and plot.
+# The collated data and the analysis results are cached in the campaign directory.
+# With report_only, only the cached results are used.
+def analyze(campaign, template, experiment, plot=None, orders=None, report_only=False):
+    vary, order = experiment_setup(experiment, campaign, orders, template)
+    cdir = analysis_cache.campaign_dir(campaign, args.workdir)
+    key = analysis_cache.cache_key(cdir, analysis_config(campaign, vary, order))
+    cached = analysis_cache.load(cdir, key)
+    if cached:
+        print('Using cached analysis results', key[:12])
+        data, results = cached
+    elif report_only:
+        print(f"{campaign}: no cached analysis results for the current runs and settings. Use --analyze.")
+        return
+    else:
+        sampler = make_sampler(vary, order, experiment)
+        data, results = collate_and_analyze(campaign, vary, order, sampler, experiment)
+        if results is None:
+            return
+        analysis_cache.save(cdir, key, data, results)
+    var = ordered_params(vary)
+    if args.sampler == 'qmc':
+        qmc_status(campaign, results)
+    report(data, results, vary, order, var)
+    if 'fidelity' in data:
+        data = data[data['fidelity'] == 1]   # plot the full runs only
+    make_plot(data, var, plot)
+    if args.time_resolved:
+        time_resolved(campaign, vary, order, plot, report_only)
+
+
+# analysis with the printed output captured, for running in a worker process
+def analyze_captured(spec):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            analyze(*spec)
+        except Exception:
+            traceback.print_exc(file=out)
+    return out.getvalue()
+
+
+# an analysis spec: campaign state file, template, experiment and (optional) plot file name
+def parse_spec(spec):
+    fields = spec.split(',')
+    if len(fields) not in (3, 4):
+        raise ValueError(f"--spec should be campaign,template,experiment[,plot], not {spec}")
+    return tuple(fields) + (None,) * (4 - len(fields))
+
+
+if args.spec:
+    specs = [parse_spec(spec) for spec in args.spec]
+else:
+    specs = [(args.campaign, args.template, args.experiment, args.plot)]
+
+if args.unpack:
+    for campaign, template, experiment, plot in specs:
+        layout.unpack(analysis_cache.campaign_dir(campaign, args.workdir))
+
+if args.report and not args.analyze:
+    # tables and plots from cached analysis results, no post-processing or collation
+    for spec in specs:
+        analyze(*spec, orders=args.orders if len(specs) == 1 else None, report_only=True)
+
+if args.pipeline:
+    # prepare, run and post-process each run as soon as the previous stage is done with it
+    my_campaign = uq.Campaign(state_file=args.campaign, work_dir=args.workdir)
+    run_dirs = runcheck.run_dirs(my_campaign.campaign_dir)
+    tasks = max(pilot.mpi_tasks(d) for d in run_dirs)
+    model_cmd = model_command(tasks if args.pin else None)
+    slots = args.parallel or (tuning['parallel'] if args.tuning else max(args.cores // tasks, 1))
+    prep_cmd = f"{cwd}/prep.sh {cwd+'/input'}"
+    post_cmd = postproc_command(args.reductions, args.postproc_memory)
+    if args.cache:
+        # cache hits are marked ok, runcheck.py does not run them again
+        cache = runcache.RunCache(args.cache, cwd+'/input', args.model)
+        runcache.fetch_campaign(cache, my_campaign.campaign_dir)
+
+    def prepare_run(d):
+        return subprocess.call(prep_cmd, shell=True, cwd=d) == 0
+
+    def run_model(d, slot):
+        cmd = pinned_command(model_cmd, slot, slots, tasks) if args.pin else model_cmd
+        subprocess.call(cmd, shell=True, cwd=d)
+        status = runcheck.read_status(d)
+        return bool(status and status['status'] in runcheck.usable)
+
+    def postprocess_model(d):
+        if postprocess_run(d, post_cmd):
+            print(f'Post-processing failed in {d}, see postproc.txt')
+            return False
+        return True
+
+    if args.monitor:
+        runs_done = threading.Event()
+        watcher = threading.Thread(target=monitor.monitor, args=(my_campaign.campaign_dir, args.monitor),
+                                   kwargs={'stop': runs_done.is_set}, daemon=True)
+        watcher.start()
+    pipeline.pipeline(run_dirs, prepare_run, run_model, postprocess_model, slots,
+                      pipeline.post_workers(args.cores, slots, tasks))
+    if args.monitor:
+        runs_done.set()
+        watcher.join()
+        monitor.monitor(my_campaign.campaign_dir, once=True, quiet=True)   # final state in progress.json
+    if args.pin:
+        pinning.print_placement(my_campaign.campaign_dir)
+    if args.cache:
+        runcache.store_campaign(cache, my_campaign.campaign_dir)
+    my_campaign.save_state(args.campaign)
+    args.analyze = True   # the runs are post-processed, analyze them
+
+if args.analyze:
+
+    # post-process the runs of all campaigns with one pool of workers
+    run_dirs = []
+    all_ok = True
+    for campaign, template, experiment, plot in specs:
+        my_campaign = uq.Campaign(state_file=campaign, work_dir=args.workdir)
+        all_ok &= check_runs(my_campaign.campaign_dir)
+        run_dirs += runcheck.run_dirs(my_campaign.campaign_dir)
+    if not all_ok:
+        sys.exit(1)
+    if not args.pipeline:   # the pipeline post-processed the runs already
+        postprocess(run_dirs, args.postproc_workers, args.reductions, args.postproc_memory)
+
+    if len(specs) == 1:
+        analyze(*specs[0], orders=args.orders)
+    else:
+        # analyze the campaigns concurrently. The workers are forked, sharing the
+        # modules imported here. Output is printed in order, when all are done.
+        ctx = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(specs), mp_context=ctx) as pool:
+            for spec, out in zip(specs, pool.map(analyze_captured, specs)):
+                print(f'=== {spec[0]} ({spec[2]}) ===')
+                print(out)
+
+# a run can be packed when it completed and was post-processed
+def reduced(run_dir):
+    status = runcheck.read_status(run_dir)
+    return bool(status and status['status'] in runcheck.usable) and os.path.exists(os.path.join(run_dir, out_file))
+
+if args.pack:
+    for campaign, template, experiment, plot in specs:
+        layout.pack(analysis_cache.campaign_dir(campaign, args.workdir), reduced)
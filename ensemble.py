@@ -0,0 +1,113 @@
+# Ensemble view of the DALES outputs of a campaign.
+#
+# EnsembleDataset collects the runs of a campaign with their parameters, and
+# exposes a netCDF variable of all runs as one array with dimensions
+# (run, time) or (run, time, z). Files are opened only when a variable is
+# requested, read by a pool of worker processes, and kept in memory for later use.
+# Files of packed runs are read from their archives, see layout.py.
+#
+# example:
+#   ens = EnsembleDataset.from_campaign('choices.json', workdir='~/work')
+#   thl = ens.sel(iadv=1).at_time('thl', 12*3600)    # (run, z) at hour 12
+#   rwp = ens.rwp()                                   # (run, time)
+
+import os
+import numpy
+import pandas
+import concurrent.futures
+import easyvvuq as uq
+import layout
+
+profiles_file = 'profiles.001.nc'
+tmser_file = 'tmser.001.nc'
+
+
+# a variable of one run, and the coordinate arrays of its dimensions
+def read_one(run_dir, filename, name):
+    with layout.open_dataset(run_dir, filename) as d:
+        var = d.variables[name]
+        data = numpy.ma.filled(numpy.ma.asarray(var[:], dtype=float), numpy.nan)
+        coords = {dim: numpy.asarray(d.variables[dim][:]) for dim in var.dimensions if dim in d.variables}
+    return coords, data
+
+
+class EnsembleDataset:
+    # run_dirs: list of run directories, params: DataFrame of parameters, one row per run
+    def __init__(self, run_dirs, params, workers=8):
+        self.run_dirs = list(run_dirs)
+        self.params = params.reset_index(drop=True)
+        self.workers = workers
+        self.cache = {}
+
+    @classmethod
+    def from_campaign(cls, state_file, workdir='/tmp', workers=8):
+        campaign = uq.Campaign(state_file=state_file, work_dir=os.path.expanduser(workdir))
+        runs = list(campaign.list_runs())
+        run_dirs = [info['run_dir'] for run_id, info in runs]
+        params = pandas.DataFrame([info['params'] for run_id, info in runs])
+        params.insert(0, 'run_id', [run_id for run_id, info in runs])
+        return cls(run_dirs, params, workers)
+
+    def __len__(self):
+        return len(self.run_dirs)
+
+    # subset of the runs with the given parameter values, e.g. sel(iadv=1, l_sb=0)
+    def sel(self, **conditions):
+        mask = numpy.ones(len(self), dtype=bool)
+        for k, v in conditions.items():
+            mask &= numpy.isclose(self.params[k].values.astype(float), v)
+        sub = EnsembleDataset([d for d, m in zip(self.run_dirs, mask) if m], self.params[mask], self.workers)
+        # share the cached arrays, restricted to the selected runs
+        for key, (coords, data) in self.cache.items():
+            sub.cache[key] = (coords, data[mask])
+        return sub
+
+    # a variable of all runs, shape (run, time, ...). Runs with fewer time steps
+    # (e.g. shorter runs) are padded with NaN. Returns (coords, data), where coords
+    # holds the coordinate arrays of the longest run.
+    def variable(self, name, filename=profiles_file):
+        key = (filename, name)
+        if key not in self.cache:
+            # worker processes, the netCDF library is not thread-safe
+            n = len(self.run_dirs)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+                parts = list(pool.map(read_one, self.run_dirs, [filename] * n, [name] * n,
+                                      chunksize=max(n // (4 * self.workers), 1)))
+            longest = max(range(len(parts)), key=lambda i: len(parts[i][1]))
+            coords = parts[longest][0]
+            shape = (len(parts),) + parts[longest][1].shape
+            data = numpy.full(shape, numpy.nan)
+            for i, (c, a) in enumerate(parts):
+                data[i, :len(a)] = a
+            self.cache[key] = (coords, data)
+        return self.cache[key]
+
+    def __getitem__(self, name):
+        return self.variable(name)[1]
+
+    def time(self, filename=profiles_file):
+        return self.variable('time', filename)[0]['time']
+
+    # a variable at the output time closest to t (seconds), shape (run, ...)
+    def at_time(self, name, t, filename=profiles_file):
+        i = numpy.abs(self.time(filename) - t).argmin()
+        return self.variable(name, filename)[1][:, i]
+
+    # vertical integral of the product of profile variables, shape (run, time)
+    def vertical_integral(self, names):
+        zh = self.variable('zm')[0]['zm']   # half-level heights
+        dzf = zh[1:] - zh[:-1]
+        prod = 1
+        for n in names:
+            prod = prod * self[n][:, :, :len(dzf)]
+        return prod @ dzf
+
+    # rain water path, as in postproc.py
+    def rwp(self):
+        return self.vertical_integral(['sv002', 'rhof'])
+
+    # time average of a variable of all runs over [t0, t1], shape (run, ...)
+    def time_mean(self, name, t0, t1, filename=profiles_file):
+        t = self.time(filename)
+        sel = (t >= t0) & (t <= t1)
+        return numpy.nanmean(self.variable(name, filename)[1][:, sel], axis=1)
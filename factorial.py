@@ -0,0 +1,95 @@
+# Factorial designs and ANOVA for discrete choices, e.g. the advection and microphysics schemes.
+#
+# Every combination of the levels of the discrete parameters (a cell) is run once for each
+# of r seeds, the same seeds for all cells. With two-level factors, a half fraction keeps
+# the cells whose +-1 codes of the two-level factors multiply to +1; with at least three
+# two-level factors the main effects are then not aliased with each other.
+#
+# In a balanced design the variance decomposes exactly into the main effects and
+# interactions of the factors, and a residual from the seeds (the internal variability).
+# The sum of squares of an effect u is N Var(E[Y | X_u]) with the lower-order effects
+# subtracted, computed for all QoIs together by the grouping in sobol.py. The F statistic
+# of an effect is its mean square over the residual mean square, with
+#   df_u = prod over i in u of (levels_i - 1),   df_res = N - 1 - sum of df_u
+# A half fraction only gives the main effects, its interactions go into the residual.
+
+import itertools
+import numpy
+import scipy.stats
+import sobol
+
+
+# the integer levels of a discrete distribution
+def levels(dist):
+    return [int(v) for v in numpy.unique(numpy.round(numpy.ravel(dist.inv(numpy.linspace(0.005, 0.995, 100)))))]
+
+
+# the cells of the half fraction, from the cells of the full factorial
+def half_fraction(cells, factor_levels):
+    two = [i for i, lv in enumerate(factor_levels) if len(lv) == 2]
+    if len(two) < 3:
+        raise ValueError(f'a half fraction needs at least three two-level factors, not {len(two)}')
+    return [c for c in cells if numpy.prod([1 if c[i] == factor_levels[i][1] else -1 for i in two]) == 1]
+
+
+# run parameter dictionaries: all cells of the discrete parameters of vary, for each of
+# replicas seeds drawn from vary['seed']
+def design(vary, replicas=1, half=False, seed=None):
+    factors = [p for p in vary if p != 'seed']
+    factor_levels = [levels(vary[p]) for p in factors]
+    cells = list(itertools.product(*factor_levels))
+    if half:
+        cells = half_fraction(cells, factor_levels)
+    numpy.random.seed(seed)
+    seeds = numpy.round(numpy.ravel(vary['seed'].sample(replicas))) if 'seed' in vary else [None] * replicas
+    runs = []
+    for s in seeds:
+        for c in cells:
+            run = dict(zip(factors, map(float, c)))
+            if s is not None:
+                run['seed'] = float(s)
+            runs.append(run)
+    return runs
+
+
+# ANOVA of the QoIs. Returns the moments, and for each effect (tuple of factor indices)
+# and the residual: sum of squares, df, fraction of the variance, F and p, arrays over the QoIs
+def anova(data, qois, factors, interactions=True):
+    X = data[factors].values.astype(float)
+    Y = data[qois].values.astype(float)
+    N, P = X.shape
+    n_levels = [len(numpy.unique(X[:, i])) for i in range(P)]
+    effects = [u for k in range(1, (P if interactions else 1) + 1) for u in itertools.combinations(range(P), k)]
+    out = sobol.analyse_block(numpy.full(N, 1 / N), Y, X, ['first'] + [u for u in effects if len(u) > 1])
+    total = N * out['var']
+    table = {}
+    for u in effects:
+        S = out['first'][:, u[0]] if len(u) == 1 else out['interactions'][u]
+        table[u] = {'ss': S * total, 'df': int(numpy.prod([n_levels[i] - 1 for i in u]))}
+    ss_res = total - sum(e['ss'] for e in table.values())
+    df_res = N - 1 - sum(e['df'] for e in table.values())
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        ms_res = ss_res / df_res if df_res > 0 else numpy.full(len(qois), numpy.nan)
+        for e in list(table.values()) + [{'ss': ss_res, 'df': df_res}]:
+            e['fraction'] = e['ss'] / total
+        for e in table.values():
+            e['F'] = e['ss'] / e['df'] / ms_res
+            e['p'] = scipy.stats.f.sf(e['F'], e['df'], df_res) if df_res > 0 else numpy.full(len(qois), numpy.nan)
+    return {'mean': out['mean'], 'var': out['var'], 'effects': table,
+            'residual': {'ss': ss_res, 'df': df_res, 'fraction': ss_res / total}}
+
+
+# the ANOVA in the structure of the EasyVVUQ analysis results. The main-effect fractions
+# are the first-order Sobol indices, the residual fraction is reported as the index of seed
+def analyse(data, qois, vary, half=False):
+    factors = [p for p in vary if p != 'seed']
+    a = anova(data, qois, factors, interactions=not half)
+    results = {'statistical_moments': {}, 'sobols_first': {}, 'sobols': {}, 'anova': a, 'factors': factors}
+    for j, qoi in enumerate(qois):
+        results['statistical_moments'][qoi] = {'mean': a['mean'][j], 'var': a['var'][j], 'std': numpy.sqrt(a['var'][j])}
+        first = {p: a['effects'][(i,)]['fraction'][j] for i, p in enumerate(factors)}
+        if 'seed' in vary:
+            first['seed'] = a['residual']['fraction'][j]
+        results['sobols_first'][qoi] = first
+        results['sobols'][qoi] = {u: numpy.array([e['fraction'][j]]) for u, e in a['effects'].items()}
+    return results
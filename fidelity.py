@@ -0,0 +1,163 @@
+# Multi-fidelity UQ: cheap coarse DALES runs as control variates for the full runs.
+#
+# The design has N_L parameter points run at low fidelity (a smaller domain with
+# the same grid spacing, and/or a shorter runtime), and the first N_H of them
+# also at full fidelity. With Y_H, Y_L the outputs of the two levels, the
+# control-variate estimate of the mean is
+#   E[Y_H] ~ mean_H(Y_H) + alpha (mean_L(Y_L) - mean_H(Y_L)),  alpha = cov(Y_H, Y_L) / var(Y_L)
+# where mean_H is over the N_H paired points and mean_L over all N_L points.
+# The same estimator is applied to E[Y^2] for the variance, and to the conditional
+# means in bins of each parameter for the first-order Sobol indices.
+#
+# The optimal ratio N_L/N_H for a two-level control variate (Peherstorfer et al. 2016,
+# SIAM J. Sci. Comput. 38, A3163) is r = sqrt(C_H/C_L * rho^2 / (1 - rho^2)),
+# from the measured cost C per run of each level and the correlation rho.
+
+import re
+import numpy
+import chaospy as cp
+
+input_filename = 'namoptions.001'
+
+
+# parameter points for the runs: n_coarse points at fidelity 0, the first n_fine also at fidelity 1
+def design(vary, n_coarse, n_fine, seed=None, rule='random'):
+    numpy.random.seed(seed)
+    dist = cp.J(*vary.values())
+    X = numpy.atleast_2d(dist.sample(n_coarse, rule=rule)).T
+    runs = []
+    for level, n in ((0, n_coarse), (1, n_fine)):
+        for x in X[:n]:
+            run = dict(zip(vary, map(float, x)))
+            run['fidelity'] = level
+            runs.append(run)
+    return runs
+
+
+def set_value(text, name, value):
+    return re.sub(r'^(\s*%s\s*=\s*)\S+' % name, r'\g<1>%s' % value, text, flags=re.MULTILINE | re.IGNORECASE)
+
+
+def get_value(text, name):
+    m = re.search(r'^\s*%s\s*=\s*([-+.\deE]+)' % name, text, flags=re.MULTILINE | re.IGNORECASE)
+    return float(m.group(1)) if m else None
+
+
+# make the rendered namelist of a run a low-fidelity one: the horizontal domain
+# divided by domain_factor at the same grid spacing, and/or a shorter runtime.
+# nprocx, nprocy are reduced if they no longer divide itot, jtot.
+def coarsen(run_dir, domain_factor=1, runtime=None):
+    filename = f'{run_dir}/{input_filename}'
+    with open(filename) as f:
+        text = f.read()
+    if domain_factor > 1:
+        for n, nproc in (('itot', 'nprocx'), ('jtot', 'nprocy')):
+            points = int(get_value(text, n)) // domain_factor
+            text = set_value(text, n, points)
+            p = int(get_value(text, nproc) or 1)
+            while p > 1 and points % p:
+                p //= 2
+            text = set_value(text, nproc, p)
+        for n in ('xsize', 'ysize'):
+            text = set_value(text, n, get_value(text, n) / domain_factor)
+    if runtime:
+        text = set_value(text, 'runtime', runtime)
+    with open(filename, 'w') as f:
+        f.write(text)
+
+
+# control-variate coefficient per column, from the paired runs
+def cv_alpha(YH, YL):
+    dH = YH - YH.mean(axis=0)
+    dL = YL - YL.mean(axis=0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        alpha = (dH * dL).sum(axis=0) / (dL * dL).sum(axis=0)
+    return numpy.nan_to_num(alpha)
+
+
+# control-variate estimate of E[g] per column. gH, gL: paired values, gL_all: all low-fidelity values
+def cv_mean(gH, gL, gL_all, alpha):
+    return gH.mean(axis=0) + alpha * (gL_all.mean(axis=0) - gL.mean(axis=0))
+
+
+# bin index of each value of x: the distinct values if there are few, else quantile bins
+def bins(x, x_all, nbins):
+    levels = numpy.unique(x_all)
+    if len(levels) <= nbins:
+        return numpy.searchsorted(levels, x), numpy.searchsorted(levels, x_all), len(levels)
+    edges = numpy.quantile(x_all, numpy.linspace(0, 1, nbins + 1)[1:-1])
+    return numpy.searchsorted(edges, x), numpy.searchsorted(edges, x_all), nbins
+
+
+# pair each fine run with the coarse run at the same point. data: collation result
+# with a 'fidelity' column. Returns the fine outputs YH, the paired coarse outputs YL
+# and their parameters XH, and the outputs Yc and parameters Xc of all coarse runs
+def pair(data, qois, var):
+    fine = data[data['fidelity'] == 1]
+    coarse = data[data['fidelity'] == 0]
+    Xc = coarse[var].values.astype(float)
+    Yc = coarse[qois].values.astype(float)
+    idx = [numpy.flatnonzero(numpy.all(numpy.isclose(Xc, x), axis=1))[0] for x in fine[var].values.astype(float)]
+    return fine[qois].values.astype(float), Yc[idx], Xc[idx], Yc, Xc
+
+
+# multi-fidelity moments and first-order Sobol indices, in the structure of
+# the EasyVVUQ analysis results
+def analyse(data, qois, var, nbins=None):
+    YH, YL, XH, Yc, Xc = pair(data, qois, var)
+
+    alpha = cv_alpha(YH, YL)
+    alpha2 = cv_alpha(YH**2, YL**2)
+    mean = cv_mean(YH, YL, Yc, alpha)
+    var_Y = numpy.maximum(cv_mean(YH**2, YL**2, Yc**2, alpha2) - mean**2, 0)
+
+    if nbins is None:
+        nbins = max(2, int(numpy.sqrt(len(YH)) // 2))
+    sobols = numpy.empty((len(qois), len(var)))
+    for i in range(len(var)):
+        bH, bL, K = bins(XH[:, i], Xc[:, i], nbins)
+        p = numpy.bincount(bL, minlength=K) / len(bL)   # probability of each bin
+        cond = numpy.empty((K, len(qois)))
+        for k in range(K):
+            h, l = bH == k, bL == k
+            if h.sum() > 1:
+                cond[k] = cv_mean(YH[h], YL[h], Yc[l], alpha)
+            else:
+                cond[k] = Yc[l].mean(axis=0) if l.any() else mean
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            sobols[:, i] = (p @ (cond - mean)**2) / var_Y
+
+    rho = numpy.array([numpy.corrcoef(YH[:, j], YL[:, j])[0, 1] for j in range(len(qois))])
+    results = {'statistical_moments': {}, 'sobols_first': {}, 'correlation': {}}
+    for j, q in enumerate(qois):
+        results['statistical_moments'][q] = {'mean': mean[j], 'var': var_Y[j], 'std': numpy.sqrt(var_Y[j])}
+        results['sobols_first'][q] = {v: sobols[j, i] for i, v in enumerate(var)}
+        results['correlation'][q] = rho[j]
+    return results
+
+
+# optimal number of fine and coarse runs for a budget, from the cost per run of
+# each level and the correlation rho between the levels. gain is the factor by which
+# the variance of the mean is smaller than with fine runs only, for the same budget.
+def allocation(cost_fine, cost_coarse, rho, budget):
+    rho2 = min(rho**2, 0.9999)
+    r = max(1.0, numpy.sqrt(cost_fine / cost_coarse * rho2 / (1 - rho2)))
+    n_fine = budget / (cost_fine + r * cost_coarse)
+    gain = 1 / ((1 + r * cost_coarse / cost_fine) * (1 - (1 - 1 / r) * rho2))
+    return int(n_fine), int(r * n_fine), gain
+
+
+# recommended split of the runs, from the measured walltime of each level and the
+# correlation of qoi between the levels. tasks: number of MPI tasks of a (fine, coarse) run,
+# the cost of a run is its walltime times its tasks. budget: total cost of all runs in
+# core-seconds, by default the cost of the current runs.
+def plan(data, qoi, var, budget=None, tasks=(1, 1), walltime='walltime'):
+    YH, YL, XH, Yc, Xc = pair(data, [qoi, walltime], var)
+    cost_fine = YH[:, 1].mean() * tasks[0]
+    cost_coarse = Yc[:, 1].mean() * tasks[1]
+    if budget is None:
+        budget = len(YH) * cost_fine + len(Yc) * cost_coarse
+    rho = numpy.corrcoef(YH[:, 0], YL[:, 0])[0, 1]
+    n_fine, n_coarse, gain = allocation(cost_fine, cost_coarse, rho, budget)
+    return {'cost_fine': cost_fine, 'cost_coarse': cost_coarse, 'rho': rho,
+            'n_fine': n_fine, 'n_coarse': n_coarse, 'gain': gain}
@@ -0,0 +1,166 @@
+# Gaussian-process emulator of the QoIs, and active-learning selection of new runs.
+#
+# The inputs are the varied parameters mapped to the unit cube by their distribution
+# (CDF), leaving out parameters that only add noise, like the random seed. Their
+# effect is the fitted noise variance of the GP. One GP with a Matern 5/2 kernel is
+# fitted per QoI; the hyperparameters are fitted by maximum likelihood on a subset of
+# the runs, so that fitting stays fast with thousands of runs.
+#
+# New runs are chosen greedily from a set of random candidate points, by
+#   'variance':   the largest predictive variance, summed over the QoIs
+#   'integrated': the largest reduction of the predictive variance integrated over
+#                 the parameter space, which the moments and Sobol indices depend on
+# After each choice, the posterior covariance of the candidates is conditioned on the
+# chosen point with a rank-one update, without refitting.
+
+import numpy
+import scipy.linalg
+import scipy.optimize
+import qmc
+
+noise_params = ('seed',)
+
+
+# Matern 5/2 kernel between the rows of X1 and X2, with length scales lengths
+def kernel(X1, X2, lengths, amp):
+    A = X1 / lengths
+    B = X2 / lengths
+    d2 = (A * A).sum(axis=1)[:, None] + (B * B).sum(axis=1)[None, :] - 2 * A @ B.T
+    d = numpy.sqrt(numpy.maximum(d2, 0) * 5)
+    return amp * (1 + d + d * d / 3) * numpy.exp(-d)
+
+
+class GaussianProcess:
+    # X: (runs, dims) inputs in the unit cube, y: (runs,) outputs
+    def __init__(self, X, y, max_fit=300, seed=0):
+        self.X = numpy.asarray(X, dtype=float)
+        y = numpy.asarray(y, dtype=float)
+        self.mu = y.mean()
+        self.sd = y.std() or 1.0
+        self.y = (y - self.mu) / self.sd
+        rng = numpy.random.default_rng(seed)
+        fit = rng.choice(len(X), min(len(X), max_fit), replace=False)
+        self.fit_hyperparameters(self.X[fit], self.y[fit])
+        self.factorize()
+
+    def nll(self, theta, X, y):
+        P = X.shape[1]
+        lengths, amp, noise = numpy.exp(theta[:P]), numpy.exp(theta[P]), numpy.exp(theta[P + 1])
+        K = kernel(X, X, lengths, amp) + (noise + 1e-8) * numpy.eye(len(X))
+        try:
+            L = scipy.linalg.cholesky(K, lower=True)
+        except numpy.linalg.LinAlgError:
+            return 1e10
+        a = scipy.linalg.cho_solve((L, True), y)
+        return 0.5 * y @ a + numpy.log(numpy.diag(L)).sum()
+
+    # maximum-likelihood length scales, amplitude and noise variance (of the standardized outputs)
+    def fit_hyperparameters(self, X, y):
+        P = X.shape[1]
+        theta0 = numpy.log(numpy.r_[numpy.full(P, 0.3), 1.0, 0.1])
+        bounds = [(numpy.log(0.02), numpy.log(20))] * P + [(numpy.log(1e-3), numpy.log(20)), (numpy.log(1e-6), numpy.log(10))]
+        res = scipy.optimize.minimize(self.nll, theta0, args=(X, y), method='L-BFGS-B', bounds=bounds)
+        self.lengths = numpy.exp(res.x[:P])
+        self.amp = numpy.exp(res.x[P])
+        self.noise = numpy.exp(res.x[P + 1])
+
+    def factorize(self):
+        K = kernel(self.X, self.X, self.lengths, self.amp) + (self.noise + 1e-8) * numpy.eye(len(self.X))
+        self.L = scipy.linalg.cholesky(K, lower=True)
+        self.alpha = scipy.linalg.cho_solve((self.L, True), self.y)
+
+    # predictive mean, in the units of the outputs
+    def predict(self, X):
+        return kernel(X, self.X, self.lengths, self.amp) @ self.alpha * self.sd + self.mu
+
+    # posterior covariance of the latent function at the points X, in units of the standardized outputs
+    def posterior_cov(self, X):
+        V = scipy.linalg.solve_triangular(self.L, kernel(self.X, X, self.lengths, self.amp), lower=True)
+        return kernel(X, X, self.lengths, self.amp) - V.T @ V
+
+
+# unit-cube inputs of the runs: the CDF of each varied parameter, except the noise parameters
+def inputs(data, vary):
+    var = [v for v in vary if v not in noise_params]
+    return numpy.stack([numpy.ravel(vary[v].fwd(data[v].values.astype(float))) for v in var], axis=1)
+
+
+def fit(data, qois, vary, max_fit=300):
+    X = inputs(data, vary)
+    return [GaussianProcess(X, data[q].values, max_fit) for q in qois]
+
+
+# indices of n candidates chosen greedily by criterion ('variance' or 'integrated')
+def select(gps, C, n, criterion='variance'):
+    covs = [gp.posterior_cov(C) for gp in gps]
+    chosen = []
+    for _ in range(min(n, len(C))):
+        score = numpy.zeros(len(C))
+        for cov, gp in zip(covs, gps):
+            d = numpy.maximum(numpy.diag(cov), 0)
+            if criterion == 'variance':
+                score += d / gp.amp
+            else:
+                score += (cov * cov).sum(axis=0) / (d + gp.noise) / gp.amp
+        score[chosen] = -numpy.inf
+        j = int(numpy.argmax(score))
+        chosen.append(j)
+        # condition the candidates on a (noisy) observation at the chosen point
+        for cov, gp in zip(covs, gps):
+            u = cov[:, j] / numpy.sqrt(cov[j, j] + gp.noise)
+            cov -= numpy.outer(u, u)
+    return chosen
+
+
+# largest predictive standard deviation of each GP over the points C, relative to the std of the outputs
+def max_error(gps, C):
+    return [numpy.sqrt(max(numpy.max(numpy.diag(gp.posterior_cov(C))), 0)) for gp in gps]
+
+
+# parameter dictionaries of the next batch of runs, or [] if the emulators of all qois
+# are within tolerance everywhere. Noise parameters (the seed) are drawn at random.
+def next_batch(data, qois, vary, n, criterion='variance', tolerance=0.05, candidates=1000, seed=None):
+    var = [v for v in vary if v not in noise_params]
+    rng = numpy.random.default_rng(seed)
+    gps = fit(data, qois, vary)
+    C = rng.random((candidates, len(var)))
+    errors = max_error(gps, C)
+    print('GP: largest relative predictive std', ' '.join(f'{q}: {e:.3f}' for q, e in zip(qois, errors)))
+    if max(errors) <= tolerance:
+        return []
+    X = qmc.to_params(C[select(gps, C, n, criterion)], {v: vary[v] for v in var})
+    runs = []
+    for x in X:
+        run = dict(zip(var, map(float, x)))
+        for v in vary:
+            if v in noise_params:
+                run[v] = float(numpy.ravel(vary[v].sample(1))[0])
+        runs.append(run)
+    return runs
+
+
+# moments, first and total Sobol indices of the emulators, estimated with n_mc Saltelli base points.
+# The noise variance of the GP is the part of the variance from the noise parameters (the seed).
+def analyse(data, qois, vary, n_mc=10000, seed=None):
+    var = [v for v in vary if v not in noise_params]
+    gps = fit(data, qois, vary)
+    rng = numpy.random.default_rng(seed)
+    A, B = rng.random((n_mc, len(var))), rng.random((n_mc, len(var)))
+    AB = [numpy.where(numpy.arange(len(var)) == i, B, A) for i in range(len(var))]
+    C = rng.random((min(n_mc, 1000), len(var)))
+    results = {'statistical_moments': {}, 'sobols_first': {}, 'sobols_total': {}, 'error': {}}
+    for q, gp, err in zip(qois, gps, max_error(gps, C)):
+        fA, fB = gp.predict(A)[:, None], gp.predict(B)[:, None]
+        fAB = numpy.stack([gp.predict(x)[:, None] for x in AB])
+        mean, std, first, total = [a[0] for a in qmc.estimates(fA, fB, fAB, numpy.arange(n_mc)[None, :])]
+        noise = gp.noise * gp.sd**2
+        total_var = std[0]**2 + noise
+        f = std[0]**2 / total_var    # fraction of the variance from the emulated parameters
+        results['statistical_moments'][q] = {'mean': mean[0], 'var': total_var, 'std': numpy.sqrt(total_var)}
+        results['sobols_first'][q] = {v: first[0, i] * f for i, v in enumerate(var)}
+        results['sobols_total'][q] = {v: total[0, i] * f for i, v in enumerate(var)}
+        for v in vary:
+            if v in noise_params:
+                results['sobols_first'][q][v] = results['sobols_total'][q][v] = 1 - f
+        results['error'][q] = err
+    return results
@@ -0,0 +1,142 @@
+# Layout of the run directories of a campaign.
+#
+# EasyVVUQ creates every run directly in <campaign_dir>/runs/Run_N. For campaigns
+# with thousands of runs, the runs can be moved to shards of at most 100 runs,
+#   runs/<N // 10000 % 100>/<N // 100 % 100>/Run_N     e.g. runs/00/12/Run_1234
+# and the new directories recorded in the campaign database, so that EasyVVUQ and
+# all stages here find them. run_dirs() finds the runs in both layouts.
+#
+# Finished, post-processed runs can be packed: the model outputs of the runs of a
+# shard go into one zip archive next to the shard directory (runs/00/12.zip), and
+# only the small files used by the analysis stay in the run directories. Files in
+# the archive are read in place with read_file() and open_dataset().
+
+import os
+import re
+import glob
+import json
+import zipfile
+from netCDF4 import Dataset
+
+layout_file = 'layout.json'
+# files that stay in the run directory when it is packed. output.txt is read by
+# runcheck.py, monitor.py and pinning.py
+keep_files = ['namoptions.001', 'status.json', 'results.csv', 'results.json', 'postproc.txt', 'placement.json',
+              'output.txt']
+
+
+def run_number(run_dir):
+    return int(re.search(r'Run_(\d+)$', run_dir.rstrip('/')).group(1))
+
+
+def shard(run_name):
+    n = int(run_name.split('_')[-1])
+    return '%02d' % (n // 10000 % 100), '%02d' % (n // 100 % 100)
+
+
+def shard_dir(campaign_dir, run_name):
+    return os.path.join(campaign_dir, 'runs', *shard(run_name), run_name)
+
+
+# run directories of a campaign in both layouts, in order of the run number
+def run_dirs(campaign_dir):
+    runs = os.path.join(campaign_dir, 'runs')
+    dirs = glob.glob(os.path.join(runs, 'Run_*')) + glob.glob(os.path.join(runs, '[0-9][0-9]', '[0-9][0-9]', 'Run_*'))
+    return sorted((d for d in dirs if os.path.isdir(d)), key=run_number)
+
+
+def is_sharded(campaign_dir):
+    return os.path.exists(os.path.join(campaign_dir, 'runs', layout_file))
+
+
+# move the runs that are not yet in a shard, and record their new directories in the campaign
+def shard_campaign(campaign):
+    runs = os.path.join(campaign.campaign_dir, 'runs')
+    os.makedirs(runs, exist_ok=True)
+    with open(os.path.join(runs, layout_file), 'w') as f:
+        json.dump({'sharded': True}, f)
+    moved = 0
+    for run_name, info in campaign.list_runs():
+        src = os.path.join(runs, run_name)
+        if os.path.isdir(src):
+            dst = shard_dir(campaign.campaign_dir, run_name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.rename(src, dst)
+            campaign.campaign_db.set_dir_for_run(run_name, dst)
+            moved += 1
+    print(f'Moved {moved} runs to shards')
+    return moved
+
+
+def archive_of(run_dir):
+    return os.path.dirname(os.path.abspath(run_dir)) + '.zip'
+
+
+_members = {}   # archive: (mtime, set of members)
+
+
+def archive_members(archive):
+    mtime = os.path.getmtime(archive)
+    if _members.get(archive, (None,))[0] != mtime:
+        with zipfile.ZipFile(archive) as z:
+            _members[archive] = (mtime, set(z.namelist()))
+    return _members[archive][1]
+
+
+def is_packed(run_dir, filename='tmser.001.nc'):
+    archive = archive_of(run_dir)
+    return (not os.path.exists(os.path.join(run_dir, filename)) and os.path.exists(archive)
+            and f'{os.path.basename(run_dir)}/{filename}' in archive_members(archive))
+
+
+# contents of a file of a run, from the run directory or from its archive
+def read_file(run_dir, filename):
+    path = os.path.join(run_dir, filename)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    with zipfile.ZipFile(archive_of(run_dir)) as z:
+        return z.read(f'{os.path.basename(run_dir)}/{filename}')
+
+
+# netCDF file of a run, opened in place or from memory if it is packed
+def open_dataset(run_dir, filename):
+    path = os.path.join(run_dir, filename)
+    if os.path.exists(path):
+        return Dataset(path, 'r')
+    return Dataset(path, 'r', memory=read_file(run_dir, filename))
+
+
+# pack the runs for which finished(run_dir) is true and that are not packed yet.
+# The files are stored uncompressed, so that they can be read in place quickly.
+def pack(campaign_dir, finished):
+    shards = {}
+    for d in run_dirs(campaign_dir):
+        files = [f for f in sorted(os.listdir(d)) if f not in keep_files and os.path.isfile(os.path.join(d, f))]
+        if files and finished(d):
+            shards.setdefault(archive_of(d), []).append((d, files))
+    packed = 0
+    for archive, runs in shards.items():
+        with zipfile.ZipFile(archive, 'a', zipfile.ZIP_STORED, allowZip64=True) as z:
+            present = set(z.namelist())
+            for d, files in runs:
+                name = os.path.basename(d)
+                for f in files:
+                    if f'{name}/{f}' not in present:
+                        z.write(os.path.join(d, f), f'{name}/{f}')
+        for d, files in runs:
+            for f in files:
+                os.remove(os.path.join(d, f))
+        packed += len(runs)
+    print(f'Packed {packed} runs in {len(shards)} archives')
+    return packed
+
+
+# extract the packed files of all runs back into their run directories
+def unpack(campaign_dir):
+    archives = [a for a in sorted(set(archive_of(d) for d in run_dirs(campaign_dir))) if os.path.exists(a)]
+    for archive in archives:
+        with zipfile.ZipFile(archive) as z:
+            z.extractall(archive[:-len('.zip')])
+        os.remove(archive)
+    print(f'Unpacked {len(archives)} archives')
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+# Progress of the runs of a campaign, while they run.
+#
+#   python3 monitor.py <campaign_dir> [--interval 60] [--once]
+# prints, for every running run, the simulated time against runtime in its namelist,
+# the speed in simulated seconds per wall second, and marks stragglers, runs slower
+# than half the median speed. The campaign ETA assumes the pending runs start as the
+# running ones finish. The same information is written to progress.json in the
+# campaign directory, for external dashboards.
+#
+# The simulated time is the last time in tmser.001.nc, reading only that value, or,
+# if the file cannot be read yet, the last 'time = ...' line in output.txt, reading
+# only what was appended since the previous poll.
+
+import os
+import re
+import json
+import time
+import argparse
+import numpy
+from netCDF4 import Dataset
+import runcheck
+
+progress_file = 'progress.json'
+time_line = re.compile(rb'^\s*time\s*[=:]\s*([-+.\deE]+)', re.IGNORECASE | re.MULTILINE)
+
+
+class Monitor:
+    def __init__(self, campaign_dir):
+        self.campaign_dir = campaign_dir
+        self.runtime = {}     # run: runtime from the namelist
+        self.seen = {}        # run: (wall time, simulated time) of the previous poll
+        self.speed = {}       # run: simulated seconds per wall second
+        self.offset = {}      # run: bytes of output.txt already read
+        self.sim = {}         # run: last simulated time found in output.txt
+        self.stat = {}        # run: ((size, mtime) of tmser.001.nc, simulated time) at the previous read
+
+    # state of a run: done, failed, running or pending
+    def state(self, d):
+        status = runcheck.read_status(d)
+        out = os.path.join(d, runcheck.output_txt)
+        started = os.path.exists(out)
+        if status and started and os.path.getmtime(out) > os.path.getmtime(os.path.join(d, runcheck.status_file)):
+            return 'running'     # a retry after a recorded failure
+        if status:
+            return 'done' if status['status'] in runcheck.usable else 'failed'
+        return 'running' if started else 'pending'
+
+    def simulated_time(self, run, d):
+        f = os.path.join(d, 'tmser.001.nc')
+        try:
+            st = os.stat(f)
+            key = (st.st_size, st.st_mtime)
+            if self.stat.get(run, (None,))[0] == key:
+                return self.stat[run][1]
+            with Dataset(f, 'r') as n:
+                t = n.variables['time']
+                value = float(t[len(t) - 1]) if len(t) else 0.0
+            self.stat[run] = (key, value)
+            return value
+        except (OSError, KeyError, IndexError, RuntimeError):
+            pass
+        # fall back to the new part of output.txt
+        try:
+            with open(os.path.join(d, runcheck.output_txt), 'rb') as f:
+                f.seek(self.offset.get(run, 0))
+                text = f.read()
+                self.offset[run] = f.tell()
+        except OSError:
+            return self.sim.get(run, 0.0)
+        times = time_line.findall(text)
+        if times:
+            self.sim[run] = float(times[-1])
+        return self.sim.get(run, 0.0)
+
+    def poll(self):
+        now = time.time()
+        runs = []
+        for d in runcheck.run_dirs(self.campaign_dir):
+            run = os.path.basename(d)
+            state = self.state(d)
+            r = {'run': run, 'state': state}
+            if state == 'running':
+                if run not in self.runtime:
+                    self.runtime[run] = runcheck.namelist_value(os.path.join(d, runcheck.input_filename), 'runtime')
+                sim = self.simulated_time(run, d)
+                if run in self.seen and now > self.seen[run][0] and sim >= self.seen[run][1]:
+                    self.speed[run] = (sim - self.seen[run][1]) / (now - self.seen[run][0])
+                self.seen[run] = (now, sim)
+                r.update(simulated=sim, runtime=self.runtime[run], speed=self.speed.get(run))
+            runs.append(r)
+        return self.summary(now, runs)
+
+    # campaign totals, ETA and stragglers
+    def summary(self, now, runs):
+        counts = {s: sum(r['state'] == s for r in runs) for s in ('done', 'running', 'pending', 'failed')}
+        running = [r for r in runs if r['state'] == 'running']
+        speeds = [r['speed'] for r in running if r['speed']]
+        median = float(numpy.median(speeds)) if speeds else None
+        eta = None
+        if median:
+            for r in running:
+                s = r['speed'] or median
+                r['eta'] = max(r['runtime'] - r['simulated'], 0) / s if r['runtime'] else None
+                r['straggler'] = bool(r['speed'] and r['speed'] < 0.5 * median)
+            runtimes = [r['runtime'] for r in running if r['runtime']]
+            finish = [r['eta'] for r in running if r['eta'] is not None]
+            if runtimes and finish:
+                # pending runs start in waves as wide as the number of running runs
+                waves = numpy.ceil(counts['pending'] / len(running))
+                eta = max(finish) + waves * numpy.mean(runtimes) / median
+        return {'time': now, 'counts': counts, 'median_speed': median, 'eta': eta, 'runs': runs}
+
+    def write(self, progress):
+        filename = os.path.join(self.campaign_dir, progress_file)
+        tmp = f'{filename}.tmp{os.getpid()}'   # monitor.py may poll the same campaign
+        with open(tmp, 'w') as f:
+            json.dump(progress, f, indent=1)
+        os.replace(tmp, filename)
+
+
+def format_time(seconds):
+    if seconds is None:
+        return '-'
+    return '%d:%02d:%02d' % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def print_progress(progress):
+    c = progress['counts']
+    print(time.strftime('%H:%M:%S'), f"done {c['done']}, running {c['running']}, pending {c['pending']},"
+          f" failed {c['failed']}, ETA {format_time(progress['eta'])}")
+    for r in progress['runs']:
+        if r['state'] == 'running':
+            frac = r['simulated'] / r['runtime'] if r['runtime'] else 0
+            speed = '%7.2f' % r['speed'] if r['speed'] else '      -'
+            print('%12s %6.1f%% %9.0f s  speed %s  ETA %s%s' % (r['run'], 100 * frac, r['simulated'], speed,
+                  format_time(r.get('eta')), '  straggler' if r.get('straggler') else ''))
+
+
+# poll every interval seconds until no runs are running or pending, or until stop() is true
+def monitor(campaign_dir, interval=60, once=False, stop=lambda: False, quiet=False):
+    m = Monitor(campaign_dir)
+    while True:
+        progress = m.poll()
+        m.write(progress)
+        if not quiet:
+            print_progress(progress)
+        c = progress['counts']
+        if once or stop() or (c['running'] == 0 and c['pending'] == 0):
+            return progress
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Progress of the runs of a campaign")
+    parser.add_argument("campaign_dir", help="campaign directory")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", default=False, help="poll once and exit")
+    args = parser.parse_args()
+    monitor(args.campaign_dir, args.interval, args.once)
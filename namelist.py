@@ -0,0 +1,167 @@
+# Pre-flight check of the rendered namelists of a campaign, before any run is started.
+#
+# Mistakes in a template/experiment combination otherwise show up only when DALES
+# starts, or after it has run for a long time. Every rendered namoptions.001 is parsed
+# as a Fortran namelist, and checked for
+#  - varied parameters that the template does not use, e.g. poissondigits without a &SOLVER section
+#  - parameter values outside the min and max of the parameter definitions
+#  - namelist entries left empty or not valid Fortran values by the template, e.g. an
+#    iadv_sv index out of range, for which jinja renders nothing
+#  - entries set directly from a parameter, {{p}} or {{p | int}}, that differ from the run's value
+#  - an MPI decomposition nprocx x nprocy that does not divide itot x jtot
+# The template is parsed once, each run needs one small file read, so thousands of
+# runs are checked in seconds.
+
+import os
+import re
+import math
+
+input_filename = 'namoptions.001'
+
+number = r'[-+]?(\d+\.?\d*|\.\d+)([eEdD][-+]?\d+)?'
+literal = re.compile(r'^(%s|\.(true|false)\.|[tf]|\'[^\']*\'|"[^"]*"|\d+\*\S*)$' % number, re.IGNORECASE)
+assignment = re.compile(r'(\w+(?:\([^)]*\))?)\s*=')
+expression = re.compile(r'{{(.*?)}}')
+direct = re.compile(r'^\s*(\w+)\s*(\|\s*int\s*)?$')
+
+
+# namelist text -> {group: {key: value text}}, names in lower case.
+# raises ValueError for text outside a group and for unterminated groups
+def parse(text):
+    groups = {}
+    group = key = None
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.split('!')[0].strip()
+        if not line:
+            continue
+        if group is None:
+            if not line.startswith('&'):
+                raise ValueError(f'line {n}: {line!r} outside a namelist group')
+            group = line[1:].split()[0].lower()
+            groups.setdefault(group, {})
+            key = None
+            line = line[1 + len(group):].strip()
+        end = line.lower() == '&end' or line.endswith('/') and line.count("'") % 2 == 0
+        if end:
+            line = line[:-1] if line.endswith('/') else ''
+        parts = assignment.split(line)
+        if parts[0].strip(' ,'):
+            if key is None:
+                raise ValueError(f'line {n}: {line!r} is not an assignment')
+            groups[group][key] += ' ' + parts[0].strip()     # continued value
+        for k, v in zip(parts[1::2], parts[2::2]):
+            key = k.lower()
+            groups[group][key] = v.strip().rstrip(',').strip()
+        if end:
+            group = None
+    if group is not None:
+        raise ValueError(f'namelist group &{group} is not terminated')
+    return groups
+
+
+def find(groups, key):
+    for g in groups.values():
+        if key in g:
+            return g[key]
+    return None
+
+
+# values of a namelist entry, separated by commas
+def items(value):
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def to_float(value):
+    return float(value.lower().replace('d', 'e'))
+
+
+# entries of the template that depend on parameters: {param: [(group, key, direct, int)]}
+# direct entries are set to the parameter value itself
+def template_keys(template, names):
+    with open(template) as f:
+        text = f.read()
+    # the expressions are replaced by their number for parsing, they may contain = and quotes
+    exprs = expression.findall(text)
+    count = iter(range(len(exprs)))
+    groups = parse(expression.sub(lambda m: '{{%d}}' % next(count), text))
+    keys = {}
+    for g, entries in groups.items():
+        for k, v in entries.items():
+            v = expression.sub(lambda m: '{{%s}}' % exprs[int(m.group(1))], v)
+            for expr in expression.findall(v):
+                m = direct.match(expr)
+                for p in names:
+                    if re.search(r'\b%s\b' % p, expr):
+                        is_direct = bool(m) and m.group(1) == p and v.strip() == '{{%s}}' % expr
+                        entry = (g, k, is_direct, bool(m and m.group(2)))
+                        if entry not in keys.setdefault(p, []):
+                            keys[p].append(entry)
+    return keys
+
+
+# problems of the template for the varied parameters
+def check_template(template, vary):
+    keys = template_keys(template, list(vary))
+    return [f'{p} is varied but not used in {os.path.basename(template)}' for p in vary if p not in keys]
+
+
+# problems of one rendered namelist, for the run parameters run_params.
+# entries set directly from a varied parameter are compared with the run's value
+def check_run(run_dir, run_params, params, keys, varied=()):
+    try:
+        with open(os.path.join(run_dir, input_filename)) as f:
+            groups = parse(f.read())
+    except OSError:
+        return [f'no {input_filename}']
+    except ValueError as e:
+        return [f'{input_filename}: {e}']
+    problems = []
+    for p, value in run_params.items():
+        if p in params and not params[p]['min'] <= value <= params[p]['max']:
+            problems.append(f"{p} = {value} outside [{params[p]['min']}, {params[p]['max']}]")
+    for p, entries in keys.items():
+        for g, k, is_direct, is_int in entries:
+            value = groups.get(g, {}).get(k)
+            if value is None:
+                problems.append(f'&{g} {k} missing')
+            elif not items(value) or not all(literal.match(v) for v in items(value)):
+                problems.append(f'&{g} {k} = {value!r} is not a valid value ({p})')
+            elif is_direct and p in varied and p in run_params:
+                expected = int(run_params[p]) if is_int else run_params[p]
+                if not math.isclose(to_float(items(value)[0]), expected, rel_tol=1e-6):
+                    problems.append(f'&{g} {k} = {value} but {p} = {expected}')
+    try:
+        for n, nproc in (('itot', 'nprocx'), ('jtot', 'nprocy')):
+            points, procs = find(groups, n), find(groups, nproc)
+            if points is not None and procs is not None and int(to_float(points)) % int(to_float(procs)):
+                problems.append(f'{nproc} = {procs} does not divide {n} = {points}')
+    except (ValueError, ZeroDivisionError):
+        problems.append('invalid itot, jtot, nprocx or nprocy')
+    return problems
+
+
+# check all runs of a campaign. runs: (run name, info) from list_runs().
+# Returns {run name: problems} of the runs with problems, and the template problems
+def check_campaign(runs, template, vary, params):
+    keys = template_keys(template, list(params))
+    failed = {}
+    for run_name, info in runs:
+        problems = check_run(info['run_dir'], info['params'], params, keys, vary)
+        if problems:
+            failed[run_name] = problems
+    return failed, check_template(template, vary)
+
+
+# problems grouped by kind, with a few example runs each
+def print_report(failed, template_problems, n_runs, examples=3):
+    for problem in template_problems:
+        print('Template:', problem)
+    kinds = {}
+    for run_name, problems in failed.items():
+        for problem in problems:
+            kinds.setdefault(re.sub(r'= \S+', '= ...', problem), []).append(run_name)
+    for kind, runs in sorted(kinds.items(), key=lambda k: -len(k[1])):
+        more = f' and {len(runs) - examples} more' if len(runs) > examples else ''
+        print(f'{len(runs):6d} runs: {kind}   ({", ".join(runs[:examples])}{more})')
+    print(f'Checked {n_runs} namelists: {len(failed)} with problems' +
+          (f', {len(template_problems)} template problems' if template_problems else ''))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+# Pilot job for DALES ensembles: one batch allocation runs many samples.
+#
+# The run directories of a campaign are listed as tasks in <campaign_dir>/pilot/,
+# one small file per run, which is moved between the subdirectories
+# todo/ -> running/ -> done/ or failed/
+# Moving a file with os.rename is atomic, so several pilots - on different nodes
+# sharing a file system, or several local processes - can work on the same list.
+# Each pilot starts runs until its cores are full, and stops starting new ones
+# when the remaining walltime is shorter than the longest run seen so far.
+# Runs that are still active when the walltime is nearly used up are killed
+# and put back in todo/, for the next pilot.
+#
+# usage, e.g. from a batch job script:
+#   python3 pilot.py <campaign_dir> --model dales4 --cores 128 --walltime 86000
+
+import os
+import re
+import sys
+import time
+import signal
+import argparse
+import subprocess
+import multiprocessing
+import runcheck
+import layout
+
+states = ['todo', 'running', 'done', 'failed']
+
+input_filename = 'namoptions.001'
+default_mpirun = 'mpirun -np {np}'
+
+
+def pilot_dir(campaign_dir):
+    return os.path.join(campaign_dir, 'pilot')
+
+
+def run_dirs(campaign_dir):
+    return layout.run_dirs(campaign_dir)
+
+
+# create a task for every run directory that is not already on the list.
+# if requeue is set, tasks left in running/ by a pilot that was killed
+# without cleaning up, and failed tasks, are moved back to todo/
+def create_tasks(campaign_dir, requeue=False):
+    pdir = pilot_dir(campaign_dir)
+    for s in states:
+        os.makedirs(os.path.join(pdir, s), exist_ok=True)
+
+    known = set()
+    for s in states:
+        known.update(os.listdir(os.path.join(pdir, s)))
+
+    n = 0
+    for d in run_dirs(campaign_dir):
+        name = os.path.basename(d)
+        if name in known:
+            continue
+        with open(os.path.join(pdir, 'todo', name), 'wt') as f:
+            # the task file holds the run directory, relative to the campaign
+            print(os.path.relpath(d, campaign_dir), file=f)
+        n += 1
+
+    if requeue:
+        for s in ['running', 'failed']:
+            for name in os.listdir(os.path.join(pdir, s)):
+                move(pdir, name, s, 'todo')
+    return n
+
+
+def count_tasks(campaign_dir):
+    pdir = pilot_dir(campaign_dir)
+    return {s: len(os.listdir(os.path.join(pdir, s))) for s in states}
+
+
+def move(pdir, name, src, dst):
+    os.rename(os.path.join(pdir, src, name), os.path.join(pdir, dst, name))
+
+
+def task_run_dir(campaign_dir, pdir, state, name):
+    with open(os.path.join(pdir, state, name)) as f:
+        return os.path.join(campaign_dir, f.read().strip())
+
+
+# number of MPI tasks a run needs: nprocx*nprocy from its namelist.
+# nprocx, nprocy = 0 means DALES chooses, we then use one rank
+def mpi_tasks(run_dir):
+    nproc = {'nprocx': 1, 'nprocy': 1}
+    with open(os.path.join(run_dir, input_filename)) as f:
+        for line in f:
+            m = re.match(r'\s*(nprocx|nprocy)\s*=\s*(\d+)', line, re.IGNORECASE)
+            if m:
+                nproc[m.group(1).lower()] = max(int(m.group(2)), 1)
+    return nproc['nprocx'] * nproc['nprocy']
+
+
+class Pilot:
+    def __init__(self, campaign_dir, command, cores, walltime=None, margin=300, poll=2):
+        self.campaign_dir = campaign_dir
+        self.pdir = pilot_dir(campaign_dir)
+        self.command = command    # shell command, {np} is replaced by the number of MPI tasks
+        self.cores = cores
+        self.deadline = time.time() + walltime - margin if walltime else None
+        self.poll = poll
+        self.active = {}          # task name -> (process, width, start time)
+        self.durations = []
+        self.widths = {}          # cache of mpi_tasks() per task name
+
+    def free_cores(self):
+        return self.cores - sum(w for p, w, t in self.active.values())
+
+    def time_left(self):
+        if self.deadline is None:
+            return float('inf')
+        return self.deadline - time.time()
+
+    # try to claim a task from todo/ that fits on the free cores
+    def claim(self):
+        free = self.free_cores()
+        for name in sorted(os.listdir(os.path.join(self.pdir, 'todo'))):
+            try:
+                if name not in self.widths:
+                    run_dir = task_run_dir(self.campaign_dir, self.pdir, 'todo', name)
+                    self.widths[name] = mpi_tasks(run_dir)
+                if self.widths[name] > self.cores:
+                    print(f'pilot: {name} needs {self.widths[name]} cores, more than {self.cores}. Skipping.')
+                    continue
+                if self.widths[name] > free:
+                    continue
+                move(self.pdir, name, 'todo', 'running')
+                return name
+            except FileNotFoundError:
+                continue  # claimed by another pilot in the meantime
+        return None
+
+    def start(self, name):
+        run_dir = task_run_dir(self.campaign_dir, self.pdir, 'running', name)
+        width = self.widths[name]
+        cmd = self.command.replace('{np}', str(width))
+        proc = subprocess.Popen(cmd, shell=True, cwd=run_dir, start_new_session=True)
+        self.active[name] = (proc, width, time.time())
+        print(f'pilot: started {name} on {width} cores')
+
+    def reap(self):
+        for name, (proc, width, t0) in list(self.active.items()):
+            if proc.poll() is None:
+                continue
+            del self.active[name]
+            if proc.returncode == 0:
+                self.durations.append(time.time() - t0)
+                move(self.pdir, name, 'running', 'done')
+            else:
+                print(f'pilot: {name} exited with code {proc.returncode}')
+                move(self.pdir, name, 'running', 'failed')
+
+    # kill the active runs and put them back in todo/ for the next pilot
+    def release(self):
+        for name, (proc, width, t0) in self.active.items():
+            try:
+                os.killpg(proc.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+            move(self.pdir, name, 'running', 'todo')
+            print(f'pilot: {name} unfinished, returned to the task list')
+        self.active = {}
+
+    def run(self):
+        def terminate(signum, frame):
+            self.release()
+            sys.exit(1)
+        signal.signal(signal.SIGTERM, terminate)
+
+        while True:
+            self.reap()
+            # start new runs only if a typical run can finish in the remaining time
+            expected = max(self.durations) if self.durations else 0
+            started = False
+            if self.time_left() > expected:
+                while True:
+                    name = self.claim()
+                    if name is None:
+                        break
+                    self.start(name)
+                    started = True
+            if not self.active and not started:
+                break
+            if self.time_left() <= 0:
+                self.release()
+                break
+            time.sleep(self.poll)
+        print(f'pilot: finished, {len(self.durations)} runs completed')
+        return len(self.durations)
+
+
+def run_pilot(campaign_dir, command, cores, walltime=None, margin=300, poll=2):
+    return Pilot(campaign_dir, command, cores, walltime, margin, poll).run()
+
+
+# local stand-in for a batch allocation: npilots pilot processes,
+# sharing the cores, working on the same task list.
+def run_local(campaign_dir, command, npilots, cores, walltime=None, margin=300, poll=2):
+    procs = []
+    for i in range(npilots):
+        p = multiprocessing.Process(target=run_pilot,
+                                    args=(campaign_dir, command, cores // npilots, walltime, margin, poll))
+        p.start()
+        procs.append(p)
+    for p in procs:
+        p.join()
+    return count_tasks(campaign_dir)
+
+
+# model command, run through runcheck.py for output checking and retries
+def model_command(model, mpirun=default_mpirun, retries=2, backoff=60):
+    cmd = f"{model} {input_filename}"
+    if mpirun:
+        cmd = f"{mpirun} {cmd}"
+    return runcheck.wrap_command(cmd, retries, backoff)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pilot job for DALES ensembles",
+                                     fromfile_prefix_chars='@')
+    parser.add_argument("campaign_dir", help="EasyVVUQ campaign directory")
+    parser.add_argument("--model", default="dales4", help="Model executable file")
+    parser.add_argument("--mpirun", default=default_mpirun,
+                        help="MPI launcher, {np} is replaced by nprocx*nprocy of the run")
+    parser.add_argument("--cores", type=int, default=os.cpu_count(), help="Number of cores in the allocation")
+    parser.add_argument("--walltime", type=float, default=None, help="Walltime of the allocation, in seconds")
+    parser.add_argument("--margin", type=float, default=300, help="Stop this many seconds before the walltime")
+    parser.add_argument("--retries", type=int, default=2, help="Number of retries for failed runs")
+    parser.add_argument("--backoff", type=float, default=60, help="Wait before the first retry, in seconds")
+    parser.add_argument("--requeue", action="store_true", default=False,
+                        help="Return tasks left running by a killed pilot, and failed tasks, to the task list")
+    args = parser.parse_args()
+
+    create_tasks(args.campaign_dir, requeue=args.requeue)
+    command = model_command(args.model, args.mpirun, args.retries, args.backoff)
+    run_pilot(args.campaign_dir, command, args.cores, args.walltime, args.margin)
+    print('tasks:', count_tasks(args.campaign_dir))
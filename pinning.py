@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# CPU pinning of concurrent runs on one node.
+#
+# Each of the concurrent runs (job slots) gets its own set of physical cores, within
+# one NUMA node (socket) when the run fits in one. Run in a run directory,
+# e.g. as a GNU parallel job with slot number {%}:
+#   python3 pinning.py --slot {%} --slots 4 --tasks 16 -- mpirun -np 16 dales4 namoptions.001
+# If the command contains {cpus}, it is replaced by the comma-separated core list, for
+# MPI binding options, e.g. mpirun --cpu-set {cpus} --bind-to core. Otherwise the command
+# is started with taskset. The placement is written to placement.json in the run directory.
+
+import os
+import sys
+import glob
+import json
+import socket
+import argparse
+import subprocess
+import runcheck
+
+placement_file = 'placement.json'
+
+
+# '0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]
+def parse_cpulist(text):
+    cpus = []
+    for part in text.strip().split(','):
+        if '-' in part:
+            a, b = part.split('-')
+            cpus.extend(range(int(a), int(b) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+
+# allowed CPUs, one hardware thread per physical core
+def physical_cores():
+    cores = []
+    seen = set()
+    for cpu in sorted(os.sched_getaffinity(0)):
+        try:
+            with open(f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list') as f:
+                siblings = tuple(parse_cpulist(f.read()))
+        except OSError:
+            siblings = (cpu,)
+        if siblings not in seen:
+            seen.add(siblings)
+            cores.append(cpu)
+    return cores
+
+
+# physical cores of each NUMA node. One node with all cores if the topology is not available.
+def numa_nodes():
+    cores = set(physical_cores())
+    nodes = []
+    for d in sorted(glob.glob('/sys/devices/system/node/node[0-9]*'), key=lambda d: int(d.split('node')[-1])):
+        with open(os.path.join(d, 'cpulist')) as f:
+            node = [c for c in parse_cpulist(f.read()) if c in cores]
+        if node:
+            nodes.append(node)
+    return nodes or [sorted(cores)]
+
+
+# core lists of the slots, tasks cores each. Slots are filled node by node, so that a
+# run stays on one node if it fits. The cores left over on the nodes are used for
+# runs spanning nodes. If there are not enough cores, slots share cores.
+def assign(nodes, slots, tasks):
+    blocks = []
+    rest = []
+    for node in nodes:
+        k = len(node) // tasks
+        blocks += [node[i * tasks:(i + 1) * tasks] for i in range(k)]
+        rest += node[k * tasks:]
+    blocks += [rest[i * tasks:(i + 1) * tasks] for i in range(len(rest) // tasks)]
+    if not blocks:
+        blocks = [sum(nodes, [])]
+    return [blocks[s % len(blocks)] for s in range(slots)]
+
+
+def node_of(cpu, nodes):
+    return [i for i, n in enumerate(nodes) if cpu in n]
+
+
+# command pinned to the cores
+def pinned_command(command, cores):
+    cpus = ','.join(map(str, cores))
+    if '{cpus}' in command:
+        return command.replace('{cpus}', cpus)
+    return f'taskset -c {cpus} {command}'
+
+
+def write_placement(run_dir, slot, cores, nodes):
+    placement = {'host': socket.gethostname(), 'slot': slot, 'cpus': cores,
+                 'nodes': sorted(set(i for c in cores for i in node_of(c, nodes)))}
+    with open(os.path.join(run_dir, placement_file), 'w') as f:
+        json.dump(placement, f)
+    return placement
+
+
+# table of the placement and walltime of the runs of a campaign
+def print_placement(campaign_dir):
+    walltimes = []
+    print('       run  slot  NUMA nodes   walltime(s)  cores')
+    for d in runcheck.run_dirs(campaign_dir):
+        try:
+            with open(os.path.join(d, placement_file)) as f:
+                p = json.load(f)
+        except OSError:
+            continue
+        w = runcheck.get_walltime(os.path.join(d, runcheck.output_txt))
+        if w is not None:
+            walltimes.append(w)
+        cpus = p['cpus']
+        print('%10s %5d %11s %13s  %d-%d (%d)' % (os.path.basename(d), p['slot'], ','.join(map(str, p['nodes'])),
+                                                   '%.1f' % w if w is not None else '-', min(cpus), max(cpus), len(cpus)))
+    if walltimes:
+        print('walltime: min %.1f, mean %.1f, max %.1f s' % (min(walltimes), sum(walltimes) / len(walltimes), max(walltimes)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a command pinned to the cores of a job slot")
+    parser.add_argument("--slot", type=int, required=True, help="job slot, 1 ... slots, e.g. {%%} of GNU parallel")
+    parser.add_argument("--slots", type=int, required=True, help="number of concurrent runs")
+    parser.add_argument("--tasks", type=int, default=1, help="cores per run")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="command")
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    nodes = numa_nodes()
+    cores = assign(nodes, args.slots, args.tasks)[args.slot - 1]
+    write_placement(os.getcwd(), args.slot, cores, nodes)
+    sys.exit(subprocess.call(pinned_command(' '.join(command), cores), shell=True))
@@ -0,0 +1,85 @@
+# Pipelined execution of a campaign on one node.
+#
+# The run directories pass through three stages, connected by queues:
+#   prepare       copy the input files into the run directory (prep.sh)
+#   run           the model, on slots concurrent runs
+#   post-process  postproc.py, as soon as the run completed, on the cores the runs leave free
+# A run starts as soon as its directory is prepared, and finished runs are post-processed
+# while the others are still simulating, so there are no idle phases between the stages.
+# The queue to the run stage holds at most slots directories, so preparation stays
+# only a little ahead of the runs.
+
+import time
+import queue
+import threading
+import traceback
+
+done = None   # end of the stream of run directories
+
+
+# start workers threads, each calling work(run_dir, slot) for the run directories from inbox,
+# slot = 1 ... workers. Directories for which work returns true are passed on to outbox.
+# An exception in work fails that directory only. The last worker to finish passes the end marker on.
+def start_stage(work, inbox, outbox, workers):
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker(slot):
+        while True:
+            d = inbox.get()
+            if d is done:
+                inbox.put(done)   # for the other workers of this stage
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last and outbox is not None:
+                    outbox.put(done)
+                return
+            try:
+                ok = work(d, slot)
+            except Exception:
+                print(f'{d}: failed')
+                traceback.print_exc()
+                ok = False
+            if ok and outbox is not None:
+                outbox.put(d)
+
+    threads = [threading.Thread(target=worker, args=(slot,), daemon=True) for slot in range(1, workers + 1)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+# prepare(run_dir), run(run_dir, slot) and postprocess(run_dir) return true on success.
+# Returns the number of runs that completed each stage.
+def pipeline(run_dirs, prepare, run, postprocess, slots, post_workers, prepare_workers=1):
+    counts = {'prepared': 0, 'run': 0, 'post-processed': 0}
+    lock = threading.Lock()
+
+    def counted(stage, work):
+        def f(d, slot):
+            ok = work(d, slot)
+            if ok:
+                with lock:
+                    counts[stage] += 1
+            return ok
+        return f
+
+    to_prepare, to_run, to_post = queue.Queue(), queue.Queue(maxsize=slots), queue.Queue()
+    start = time.time()
+    threads = (start_stage(counted('prepared', lambda d, slot: prepare(d)), to_prepare, to_run, prepare_workers) +
+               start_stage(counted('run', run), to_run, to_post, slots) +
+               start_stage(counted('post-processed', lambda d, slot: postprocess(d)), to_post, None, post_workers))
+    for d in run_dirs:
+        to_prepare.put(d)
+    to_prepare.put(done)
+    for t in threads:
+        t.join()
+    print(f'Pipeline: {len(run_dirs)} runs, ' + ', '.join(f'{n} {stage}' for stage, n in counts.items()) +
+          f' in {time.time() - start:.0f} s, {slots} concurrent runs, {post_workers} post-processing workers')
+    return counts
+
+
+# post-processing workers on the cores left free by the runs, at least one
+def post_workers(cores, slots, tasks):
+    return max(cores - slots * tasks, 1)
@@ -7,7 +7,7 @@
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-poisson.template --campaign=poissondigits-seedparam.json --experiment=poisson --prepare
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-poisson.template --campaign=poissondigits-seedparam.json --experiment=poisson --run
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-poisson.template --campaign=poissondigits-seedparam.json --experiment=poisson --fetch
-python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-poisson.template --campaign=poissondigits-seedparam.json --experiment=poisson --analyze --plot poisson.pdf
+#python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-poisson.template --campaign=poissondigits-seedparam.json --experiment=poisson --analyze --plot poisson.pdf
 
 # Choices
 # -------
@@ -15,7 +15,7 @@ python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --te
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-choices.template --campaign=choices.json --experiment=choices --prepare
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-choices.template --campaign=choices.json --experiment=choices --run
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-choices.template --campaign=choices.json --experiment=choices --fetch
-python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-choices.template --campaign=choices.json --experiment=choices --analyze --plot choices.pdf
+#python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-choices.template --campaign=choices.json --experiment=choices --analyze --plot choices.pdf
 
 # Physics  v2 with smaller z0 range
 # -------
@@ -24,7 +24,7 @@ python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --te
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0_v2.json --experiment=physics_z0 --prepare
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0_v2.json --experiment=physics_z0 --run
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0_v2.json --experiment=physics_z0 --fetch
-python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0_v2.json --experiment=physics_z0 --analyze --plot physics.pdf
+#python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0_v2.json --experiment=physics_z0 --analyze --plot physics.pdf
 
 
 ############ older runs
@@ -35,7 +35,7 @@ python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --te
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions.template --campaign=subgrid.json --experiment=subgrid --prepare
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions.template --campaign=subgrid.json --experiment=subgrid --run
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions.template --campaign=subgrid.json --experiment=subgrid --fetch
-python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions.template --campaign=subgrid.json --experiment=subgrid --analyze --plot subgrid.pdf
+#python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions.template --campaign=subgrid.json --experiment=subgrid --analyze --plot subgrid.pdf
 
 # physics_z0   - v1 with wide z0 range 1e-4 ... 1e-1
 # ----------
@@ -45,4 +45,9 @@ python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --te
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0.json --experiment=physics_z0 --fetch
 #python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --fab --template=namoptions-z0.template --campaign=physics_z0.json --experiment=physics_z0 --analyze --plot physics-large-z0.svg
 
-
+############ analysis of all four campaigns above, concurrently in one invocation
+python easyvvuq_dales.py --workdir=/home/jansson/code/VECMA/rico/work --analyze \
+       --spec poissondigits-seedparam.json,namoptions-poisson.template,poisson,poisson.pdf \
+       --spec choices.json,namoptions-choices.template,choices,choices.pdf \
+       --spec physics_z0_v2.json,namoptions-z0.template,physics_z0,physics.pdf \
+       --spec subgrid.json,namoptions.template,subgrid,subgrid.pdf
@@ -2,15 +2,70 @@
 
 # quick post-processor for UQ of DALES runs
 # reads DALES output files, extracts interesting
-# quantities, averages them over last half of the run.
-# Writes output to results.csv
+# quantities, and reduces them over time windows
+# (by default, averages over the last 4 h or the last half of the run).
+# Writes output to results.csv and results.json
+#
+# The reductions are declared in a specification, see default_spec below.
+# Another specification can be given as a JSON file on the command line:
+#   python3 postproc.py reductions.json [--max_memory MB]
+# All windows and statistics of a file are evaluated together, as matrix
+# operations on a (time x variable) array.
 
+import argparse
 import numpy
 import json
 from netCDF4 import Dataset
 import subprocess
 import glob
 
+# QoI names: <name>[_<statistic>][_<window>], the statistic is left out for the mean
+# and the window for the default window, so that the default QoIs are named as before.
+default_spec = {
+    # time windows. 'default' is the last 4 h, or the last half of the run if it is shorter than 8 h,
+    # 'last': the last N seconds, 'start'/'end': a fixed interval in seconds,
+    # 'fraction': the last fraction of the run
+    'windows': {
+        '': {'type': 'default'},
+    },
+    # mean, std, min, max, or percentiles as p<N> e.g. p10, p90
+    'statistics': ['mean'],
+    # QoI name: variable in tmser.001.nc
+    'timeseries': {
+        'cfrac': 'cfrac',      # global cloud fraction
+        'lwp': 'lwp_bar',
+        'zb': 'zb',
+        'zi': 'zi',
+        'wq': 'wq',
+        'wtheta': 'wtheta',
+        'we': 'we',
+    },
+    # QoI name: variable in profiles.001.nc, taken at the lowest level
+    'surface': {
+        'prec': 'precmn',      # precipitation flux at lowest level
+    },
+    # QoI name: variables in profiles.001.nc, whose product is integrated vertically
+    'integrals': {
+        'rwp': ['sv002', 'rhof'],  # rain water path, from qr * rhof * dzf
+    },
+    # memory limit for reading profiles.001.nc, in MB. The profiles are read in chunks of time steps.
+    'max_memory': 256,
+    # time-averaged vertical profiles, written only to results.json
+    'profiles': {
+        'qr': 'sv002',
+        'ql': 'ql',
+        'qt': 'qt',
+        'thl': 'thl',
+        'u': 'u',
+        'v': 'v',
+        'zcfrac': 'cfrac',     # z-dependent cloud fraction
+    },
+}
+
+# order of the QoIs in results.csv
+csv_columns = ['cfrac', 'lwp', 'rwp', 'zb', 'zi', 'prec', 'wq', 'wtheta', 'we']
+
+
 # https://stackoverflow.com/a/136280/1333273
 def tail(f, n):
     proc = subprocess.Popen(['tail', '-n', str(n), f], stdout=subprocess.PIPE)
@@ -21,7 +76,7 @@ def tail(f, n):
 # select time index range for averaging.
 # last 4 h or last half of simulation if total time < 8h
 def sel_range(time):
-    l = len(gcfrac)
+    l = len(time)
     tlast = time[-1]
     if tlast > 8*3600:
         imin = numpy.searchsorted(time, tlast-4*3600)
@@ -30,66 +85,143 @@ def sel_range(time):
     return imin, l
 
 
+# index range of a window
+def window_range(time, window):
+    kind = window.get('type')
+    if kind == 'default':
+        return sel_range(time)
+    if 'last' in window:
+        return numpy.searchsorted(time, time[-1] - window['last']), len(time)
+    if 'fraction' in window:
+        return len(time) - int(round(len(time) * window['fraction'])), len(time)
+    imin = numpy.searchsorted(time, window.get('start', time[0]))
+    imax = numpy.searchsorted(time, window.get('end', time[-1]), side='right')
+    return imin, imax
+
+
+# (windows x time) 0/1 matrix selecting the time steps of each window
+def window_matrix(time, windows):
+    M = numpy.zeros((len(windows), len(time)))
+    for i, w in enumerate(windows.values()):
+        imin, imax = window_range(time, w)
+        M[i, imin:imax] = 1
+    return M
+
+
+def qoi_name(name, stat, window):
+    if stat != 'mean':
+        name += '_' + stat
+    if window:
+        name += '_' + window
+    return name
+
+
+# netCDF variable as a float array, with masked values as NaN
+def read(var, index=slice(None)):
+    return numpy.ma.filled(numpy.ma.asarray(var[index], dtype=float), numpy.nan)
 
 
-d = Dataset("tmser.001.nc", 'r')
+# reduce the columns of X (time x variables) over all windows and statistics.
+# NaN values are left out, like masked values in the netCDF files.
+# Returns a dictionary QoI name: value
+def reduce(time, X, names, windows, statistics):
+    M = window_matrix(time, windows)             # (W, T)
+    valid = ~numpy.isnan(X)
+    Xz = numpy.where(valid, X, 0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        n = M @ valid                            # (W, V) number of values in each window
+        mean = (M @ Xz) / n
+        out = {'mean': mean}
+        if 'std' in statistics:
+            D = (Xz[None, :, :] - mean[:, None, :]) * valid[None, :, :]    # (W, T, V)
+            out['std'] = numpy.sqrt(numpy.einsum('wt,wtv->wv', M, D * D) / n)
+        order_stats = [s for s in statistics if s in ('min', 'max') or s.startswith('p')]
+        if order_stats:
+            # values outside the window are NaN
+            W = numpy.where((M[:, :, None] > 0) & valid[None, :, :], X[None, :, :], numpy.nan)
+            for s in order_stats:
+                if s == 'min':
+                    out[s] = numpy.nanmin(W, axis=1)
+                elif s == 'max':
+                    out[s] = numpy.nanmax(W, axis=1)
+                else:
+                    out[s] = numpy.nanpercentile(W, float(s[1:]), axis=1)
 
-time1 = d.variables['time'][:]
-gcfrac   = d.variables['cfrac'][:]     # global cloud fraction
-lwp_bar = d.variables['lwp_bar'][:]
-zb = d.variables['zb'][:]
-zi = d.variables['zi'][:]
-wq = d.variables['wq'][:]
-wtheta = d.variables['wtheta'][:]
-we = d.variables['we'][:]
+    results = {}
+    for s in statistics:
+        for i, w in enumerate(windows):
+            for j, name in enumerate(names):
+                results[qoi_name(name, s, w)] = float(out[s][i, j])
+    return results
 
-imin, l = sel_range(time1)
-print('Averaging from %.1f to %.1f h'%(time1[imin]/3600, time1[-1]/3600))
 
-gcfrac_avg = numpy.mean(gcfrac[imin:l])
-lwp_bar_avg = numpy.mean(lwp_bar[imin:l])
-zb_avg = numpy.mean(zb[imin:l])
-zi_avg = numpy.mean(zi[imin:l])
-wq_avg = numpy.mean(wq[imin:l])
-wtheta_avg = numpy.mean(wtheta[imin:l])
-we_avg = numpy.mean(we[imin:l])
+def print_windows(time, windows):
+    for w in windows.values():
+        imin, imax = window_range(time, w)
+        print('Averaging from %.1f to %.1f h'%(time[imin]/3600, time[imax-1]/3600))
 
-p = Dataset("profiles.001.nc", 'r')
-# precipitation flux at lowest level
-time2   = p.variables["time"][:]  
-prec    = p.variables["precmn"][:,0]  
-qr      = p.variables["sv002"][:,:]
-ql      = p.variables["ql"][:,:]
-u       = p.variables["u"][:,:]
-v       = p.variables["v"][:,:]
-qt      = p.variables["qt"][:,:]
-thl     = p.variables["thl"][:,:]
-rhof    = p.variables["rhof"][:,:]
-zcfrac  = p.variables["cfrac"][:,:]  # z-dependent cloud fraction
-zh      = p.variables["zm"][:]       # half-level heights  # dzf(k) = zh(k+1) - zh(k)
-dzf = zh[1:] - zh[:-1]
 
+# reductions of the time series in tmser.001.nc
+def reduce_tmser(filename, spec):
+    with Dataset(filename, 'r') as d:
+        time = read(d.variables['time'])
+        names = list(spec['timeseries'])
+        X = numpy.stack([read(d.variables[spec['timeseries'][q]]) for q in names], axis=1)
+    print_windows(time, spec['windows'])
+    return reduce(time, X, names, spec['windows'], spec['statistics'])
 
-# print (len(dzf), len(zh), len(rhof[0,:]))
-#print ('dzf', dzf)
-ldzf = len(dzf)
-rwp = numpy.sum(qr[:,0:ldzf] * rhof[:,0:ldzf] * dzf[:], axis=1)  # rwp over time
-#print ('rwp', rwp)
 
-imin, l = sel_range(time2)
-print('Averaging from %.1f to %.1f h'%(time2[imin]/3600, time2[-1]/3600))
+# number of time steps to read at once, so that the arrays held in memory
+# stay below max_memory MB: two (time x z) variables, and one temporary
+def chunk_length(nz, max_memory):
+    return max(1, int(max_memory * 2**20) // (3 * 8 * nz))
 
 
-prec_avg = numpy.mean(prec[imin:l])
-rwp_avg = numpy.mean(rwp[imin:l])
+# reductions of profiles.001.nc: surface values, vertical integrals, and time-averaged profiles.
+# The (time x z) variables are read in chunks of time steps, and reduced as they are read,
+# so that the memory use is bounded by spec['max_memory'] (MB).
+def reduce_profiles(filename, spec):
+    with Dataset(filename, 'r') as p:
+        time = read(p.variables['time'])
+        zh = read(p.variables['zm'])       # half-level heights  # dzf(k) = zh(k+1) - zh(k)
+        dzf = zh[1:] - zh[:-1]
+        ldzf = len(dzf)
+        M = window_matrix(time, spec['windows'])
+        chunk = chunk_length(len(zh), spec['max_memory'])
+
+        names = list(spec['surface']) + list(spec['integrals'])
+        columns = numpy.empty((len(time), len(names)))   # scalar time series, small
+        sums = {q: 0 for q in spec['profiles']}          # per-window sums of the profiles
+        counts = {q: 0 for q in spec['profiles']}
+        for t0 in range(0, len(time), chunk):
+            t1 = min(t0 + chunk, len(time))
+            j = 0
+            for q, v in spec['surface'].items():
+                columns[t0:t1, j] = read(p.variables[v], (slice(t0, t1), 0))
+                j += 1
+            for q, vs in spec['integrals'].items():
+                prod = read(p.variables[vs[0]], (slice(t0, t1), slice(0, ldzf)))
+                for v in vs[1:]:
+                    prod *= read(p.variables[v], (slice(t0, t1), slice(0, ldzf)))
+                columns[t0:t1, j] = prod @ dzf  # vertical integral, as a function of time
+                j += 1
+            for q, v in spec['profiles'].items():
+                P = read(p.variables[v], (slice(t0, t1), slice(None)))
+                valid = ~numpy.isnan(P)
+                sums[q] = sums[q] + M[:, t0:t1] @ numpy.where(valid, P, 0)
+                counts[q] = counts[q] + M[:, t0:t1] @ valid
+
+    print_windows(time, spec['windows'])
+    results = reduce(time, columns, names, spec['windows'], spec['statistics'])
+
+    # time-averaged profiles, in every window
+    for q in spec['profiles']:
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            avg = sums[q] / counts[q]
+        for i, w in enumerate(spec['windows']):
+            results[qoi_name(q, 'mean', w)] = avg[i].tolist()
+    return results
 
-qr_avg     = numpy.mean(qr[imin:l], axis=0)
-ql_avg     = numpy.mean(ql[imin:l], axis=0)
-qt_avg     = numpy.mean(qt[imin:l], axis=0)
-thl_avg    = numpy.mean(thl[imin:l], axis=0)
-u_avg      = numpy.mean(u[imin:l], axis=0)
-v_avg      = numpy.mean(v[imin:l], axis=0)
-zcfrac_avg = numpy.mean(zcfrac[imin:l], axis=0)
 
 # get wall clock time from output file
 def get_walltime(filename):
@@ -98,46 +230,62 @@ def get_walltime(filename):
         return float(t.split(b'=')[-1])
     except:
         return None
-    
-# extract wallclock time from output text file.
-# try several possibilities for the output file name
-out_files = glob.glob("output.txt")
-out_files.extend(glob.glob("*.output"))
-walltime = get_walltime(out_files[0])
-print('output file:', out_files[0], 'walltime:', walltime)
-
-with open('results.csv', 'wt') as out_file:
-    # needs one row of headers, then row(s) of data
-    # spaces not allowed in column names (or the space becomes part of the name)
-    print("cfrac,lwp,rwp,zb,zi,prec,wq,wtheta,we,walltime", file=out_file)
-    print(f"{gcfrac_avg},{lwp_bar_avg},{rwp_avg},{zb_avg},{zi_avg},{prec_avg},{wq_avg},{wtheta_avg},{we_avg},{walltime}", file=out_file)
-
-
-
-# JSON output - can also include vertical profiles
-results = {'cfrac' : float(gcfrac_avg),
-           'lwp' : float(lwp_bar_avg),
-           'rwp' : float(rwp_avg),
-           'zb' : float(zb_avg),
-           'zi' : float(zi_avg),
-           'prec' : float(prec_avg),
-           'wq' : float(wq_avg),
-           'wtheta' : float(wtheta_avg),
-           'we' : float(we_avg),
-           'qr' : qr_avg.tolist(),
-           'ql' : ql_avg.tolist(),
-           'qt' : qt_avg.tolist(),
-           'thl' : thl_avg.tolist(),
-           'u' : u_avg.tolist(),
-           'v' : v_avg.tolist(),
-           'zcfrac' : zcfrac_avg.tolist(),
-           'walltime' : walltime,
-}
 
-#print(results)
-with open('results.json', 'w') as out_file:
-    json.dump(results, out_file, indent=2)
 
+# the specification, with the default window and the mean always included,
+# so that the default QoIs are always in the results
+def load_spec(filename=None):
+    spec = dict(default_spec)
+    if filename:
+        with open(filename) as f:
+            spec.update(json.load(f))
+    if '' not in spec['windows']:
+        spec['windows'] = {'': default_spec['windows'][''], **spec['windows']}
+    if 'mean' not in spec['statistics']:
+        spec['statistics'] = ['mean'] + spec['statistics']
+    return spec
+
+
+# names of the scalar QoIs of a specification, in the order of the columns of results.csv
+def qoi_columns(spec):
+    scalars = []
+    for names in (list(spec['timeseries']), list(spec['surface']) + list(spec['integrals'])):
+        scalars += [qoi_name(name, s, w) for s in spec['statistics'] for w in spec['windows'] for name in names]
+    return [c for c in csv_columns if c in scalars] + [c for c in scalars if c not in csv_columns]
+
+
+def main(spec):
+    results = reduce_tmser("tmser.001.nc", spec)
+    results.update(reduce_profiles("profiles.001.nc", spec))
+
+    # extract wallclock time from output text file.
+    # try several possibilities for the output file name
+    out_files = glob.glob("output.txt")
+    out_files.extend(glob.glob("*.output"))
+    walltime = get_walltime(out_files[0])
+    print('output file:', out_files[0], 'walltime:', walltime)
+    results['walltime'] = walltime
+
+    columns = qoi_columns(spec) + ['walltime']
+    with open('results.csv', 'wt') as out_file:
+        # needs one row of headers, then row(s) of data
+        # spaces not allowed in column names (or the space becomes part of the name)
+        print(','.join(columns), file=out_file)
+        print(','.join(str(results[c]) for c in columns), file=out_file)
 
+    # JSON output - can also include vertical profiles
+    with open('results.json', 'w') as out_file:
+        json.dump(results, out_file, indent=2)
+    return results
 
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Post-processing of a DALES run")
+    parser.add_argument("spec", nargs='?', default=None, help="JSON file with the reduction specification")
+    parser.add_argument("--max_memory", type=float, default=None,
+                        help="memory limit in MB for reading the profiles")
+    args = parser.parse_args()
+    spec = load_spec(args.spec)
+    if args.max_memory:
+        spec['max_memory'] = args.max_memory
+    main(spec)
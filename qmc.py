@@ -0,0 +1,135 @@
+# Quasi-Monte Carlo sampling in batches, with Saltelli estimates of the Sobol indices.
+#
+# Each base point k of a randomly shifted low-discrepancy sequence (Sobol or Halton)
+# in 2P dimensions gives two parameter points A_k and B_k, and P points AB_k^i, which
+# are A_k with parameter i taken from B_k. That is P+2 runs per base point. With
+# f_A, f_B, f_AB^i the model outputs (Saltelli et al. 2010, Comput. Phys. Commun. 181, 259):
+#   first order  S_i  = mean(f_B (f_AB^i - f_A)) / Var(Y)
+#   total        ST_i = mean((f_A - f_AB^i)^2) / (2 Var(Y))
+# Batches continue the same sequence, so the campaign can be extended until the
+# bootstrap confidence intervals (resampling the base points) are narrower than a tolerance.
+# The sampling state of a campaign is kept in a small file next to the campaign state file.
+
+import os
+import json
+import numpy
+import chaospy as cp
+import bootstrap
+
+
+def state_file(campaign):
+    return os.path.splitext(campaign)[0] + '.qmc.json'
+
+
+def load_state(campaign):
+    with open(state_file(campaign)) as f:
+        return json.load(f)
+
+
+def save_state(campaign, state):
+    with open(state_file(campaign), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+# points start ... start+n-1 of the sequence in the unit cube of dimension dim,
+# shifted by a random vector modulo 1 (Cranley-Patterson rotation). Shape (n, dim)
+def unit_points(dim, start, n, rule='sobol', seed=0):
+    U = cp.J(*[cp.Uniform(0, 1)] * dim).sample(start + n, rule=rule)
+    U = numpy.atleast_2d(U).T[start:]
+    shift = numpy.random.default_rng(seed).random(dim)
+    return (U + shift) % 1
+
+
+# unit-cube values to parameter values, rounding the discrete parameters
+def to_params(U, vary):
+    X = numpy.empty_like(U)
+    for i, dist in enumerate(vary.values()):
+        X[:, i] = numpy.ravel(dist.inv(U[:, i]))
+        if getattr(dist, 'interpret_as_integer', False):
+            X[:, i] = numpy.round(X[:, i])
+    return X
+
+
+# run parameter dictionaries for base points start ... start+n-1.
+# qmc_point is the index of the base point, qmc_matrix 0 for A, P+1 for B, i+1 for AB^i
+def batch(vary, start, n, rule='sobol', seed=0):
+    P = len(vary)
+    U = unit_points(2 * P, start, n, rule, seed)
+    XA = to_params(U[:, :P], vary)
+    XB = to_params(U[:, P:], vary)
+    runs = []
+    for k in range(n):
+        rows = [XA[k]] + [numpy.where(numpy.arange(P) == i, XB[k], XA[k]) for i in range(P)] + [XB[k]]
+        for m, x in enumerate(rows):
+            run = dict(zip(vary, map(float, x)))
+            run['qmc_point'] = start + k
+            run['qmc_matrix'] = m
+            runs.append(run)
+    return runs
+
+
+# outputs arranged by base point: fA (N, Q), fB (N, Q), fAB (P, N, Q).
+# Base points without all P+2 runs are left out.
+def arrange(data, qois, P):
+    point = data['qmc_point'].values.astype(int)
+    matrix = data['qmc_matrix'].values.astype(int)
+    points = numpy.unique(point)
+    complete = points[[numpy.sum(point == p) == P + 2 for p in points]]
+    Y = numpy.full((P + 2, len(complete), len(qois)), numpy.nan)
+    index = numpy.searchsorted(complete, point)
+    ok = numpy.isin(point, complete)
+    Y[matrix[ok], index[ok]] = data[qois].values.astype(float)[ok]
+    return Y[0], Y[P + 1], Y[1:P + 1]
+
+
+# Saltelli estimates for a batch of resamples. idx: (B, N) indices of the base points
+# returns mean, std (B, Q), first, total (B, Q, P)
+def estimates(fA, fB, fAB, idx):
+    A, Bm, AB = fA[idx], fB[idx], fAB[:, idx]         # (B, N, Q), (P, B, N, Q)
+    AB = numpy.moveaxis(AB, 0, -1)                    # (B, N, Q, P)
+    mean = 0.5 * (A.mean(axis=1) + Bm.mean(axis=1))
+    var = 0.5 * (A.var(axis=1) + Bm.var(axis=1))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        first = (Bm[..., None] * (AB - A[..., None])).mean(axis=1) / var[..., None]
+        total = 0.5 * ((A[..., None] - AB)**2).mean(axis=1) / var[..., None]
+    return mean, numpy.sqrt(var), first, total
+
+
+# moments, first and total Sobol indices, and bootstrap intervals in the structure
+# of bootstrap.bootstrap_intervals (results['intervals']). results['error'] is the largest
+# half-width of the intervals of the Sobol indices, and of the mean relative to the standard deviation.
+def analyse(data, qois, vary, n_boot=500, level=0.95, seed=None):
+    var = list(vary)
+    fA, fB, fAB = arrange(data, qois, len(var))
+    N = len(fA)
+    mean, std, first, total = [a[0] for a in estimates(fA, fB, fAB, numpy.arange(N)[None, :])]
+    idx = numpy.random.default_rng(seed).integers(0, N, size=(n_boot, N))
+    b_mean, b_std, b_first, b_total = estimates(fA, fB, fAB, idx)
+
+    ci_mean = bootstrap.confidence_interval(b_mean, level)
+    ci_std = bootstrap.confidence_interval(b_std, level)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        ci_percent = bootstrap.confidence_interval(100 * b_std / b_mean, level)
+        err_mean = 0.5 * (ci_mean[1] - ci_mean[0]) / std
+    ci_first = bootstrap.confidence_interval(b_first, level)
+    ci_total = bootstrap.confidence_interval(b_total, level)
+    err_sobol = 0.5 * numpy.maximum(ci_first[1] - ci_first[0], ci_total[1] - ci_total[0]).max(axis=1)
+
+    results = {'statistical_moments': {}, 'sobols_first': {}, 'sobols_total': {},
+               'intervals': {}, 'error': {}, 'points': N}
+    for j, q in enumerate(qois):
+        results['statistical_moments'][q] = {'mean': mean[j], 'var': std[j]**2, 'std': std[j]}
+        results['sobols_first'][q] = {v: first[j, i] for i, v in enumerate(var)}
+        results['sobols_total'][q] = {v: total[j, i] for i, v in enumerate(var)}
+        results['intervals'][q] = {'mean': tuple(ci_mean[:, j]),
+                                   'std': tuple(ci_std[:, j]),
+                                   'std_percent': tuple(ci_percent[:, j]),
+                                   'sobols_first': {v: tuple(ci_first[:, j, i]) for i, v in enumerate(var)},
+                                   'sobols_total': {v: tuple(ci_total[:, j, i]) for i, v in enumerate(var)}}
+        results['error'][q] = max(err_mean[j], err_sobol[j])
+    return results
+
+
+# QoIs whose error is above the tolerance
+def unconverged(results, tolerance, qois=None):
+    return [q for q in (qois or results['error']) if not results['error'][q] <= tolerance]
@@ -0,0 +1,74 @@
+# Order refinement for SC campaigns.
+#
+# The Clenshaw-Curtis rule used by the SC sampler is nested: the nodes of
+# order n are a subset of the nodes of order 2n (for n a power of 2).
+# When the order of an existing campaign is raised, only the new nodes need
+# model runs. The orders of a refined campaign are kept in a small file next
+# to the campaign state file, and used by later stages.
+
+import os
+import json
+import numpy
+
+
+def orders_file(campaign):
+    return os.path.splitext(campaign)[0] + '.orders.json'
+
+
+# orders of a refined campaign, or default if the campaign was not refined
+def load_orders(campaign, default):
+    try:
+        with open(orders_file(campaign)) as f:
+            return tuple(json.load(f)['orders'])
+    except OSError:
+        return default
+
+
+def save_orders(campaign, orders):
+    with open(orders_file(campaign), 'w') as f:
+        json.dump({'orders': list(orders)}, f)
+
+
+# a new campaign with the same state file name starts without the orders of the old one
+def clear_orders(campaign):
+    if os.path.exists(orders_file(campaign)):
+        os.remove(orders_file(campaign))
+
+
+def is_refined(campaign):
+    return os.path.exists(orders_file(campaign))
+
+
+# for each node (rows of nodes), the index of the matching point, or -1
+def match_nodes(nodes, points, rtol=1e-9, atol=1e-12):
+    nodes = numpy.atleast_2d(numpy.asarray(nodes, dtype=float))
+    points = numpy.atleast_2d(numpy.asarray(points, dtype=float))
+    if len(points) == 0:
+        return numpy.full(len(nodes), -1)
+    same = numpy.all(numpy.isclose(nodes[:, None, :], points[None, :, :], rtol=rtol, atol=atol), axis=2)
+    return numpy.where(same.any(axis=1), same.argmax(axis=1), -1)
+
+
+# parameter dictionaries for the nodes of sampler that are not among
+# the runs already in the campaign (runs: list of parameter dictionaries)
+def new_nodes(sampler, runs, var):
+    nodes = sampler.xi_d
+    points = [[r[v] for v in var] for r in runs]
+    index = match_nodes(nodes, points)
+    print(f'Refinement: {len(nodes)} nodes, {numpy.sum(index >= 0)} already run, {numpy.sum(index < 0)} new')
+    return [dict(zip(var, map(float, node))) for node in nodes[index < 0]]
+
+
+# for each node of the sampler, the index of its run (rows of points). Runs that are
+# not nodes of the sampler, e.g. of an earlier, non-nested order, are left out.
+def node_index(sampler, points):
+    index = match_nodes(sampler.xi_d, points)
+    if numpy.any(index < 0):
+        raise ValueError(f'{numpy.sum(index < 0)} nodes of the sampler have no run. Use --refine to add them.')
+    return index
+
+
+# reorder the rows of the collation result to follow the node order of the sampler,
+# as the SC analysis expects. Runs that are not nodes of the sampler are dropped.
+def sort_to_nodes(data, sampler, var):
+    return data.iloc[node_index(sampler, data[var].values)].reset_index(drop=True)
@@ -0,0 +1,129 @@
+# Cache of DALES model results, shared between campaigns.
+#
+# A run is identified by a hash of the rendered namelist namoptions.001, the
+# input files (from the input/ directory) and the model executable. Runs with
+# the same key give the same results, so the outputs of a completed run are
+# stored under <cache_dir>/<key[:2]>/<key>/ and copied into the run directory
+# of any later run with the same key, instead of running DALES again. The files
+# are copied, not hard linked, so that rewriting an output in a run directory,
+# e.g. output.txt on a retry, does not change the cache entry.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import runcheck
+import layout
+
+input_filename = 'namoptions.001'
+# files in a run directory that are not model outputs
+not_outputs = [input_filename, runcheck.status_file, 'results.csv', 'results.json', 'postproc.txt']
+
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# hash of the model executable. If it is not found, the name is used.
+def model_hash(model):
+    path = shutil.which(os.path.expanduser(model))
+    if path:
+        return file_hash(path)
+    return hashlib.sha256(model.encode()).hexdigest()
+
+
+class RunCache:
+    def __init__(self, cache_dir, input_dir, model):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.input_dir = input_dir
+        self.input_files = sorted(os.listdir(input_dir))
+        # hashes common to all runs, computed once
+        self.common = hashlib.sha256()
+        self.common.update(model_hash(model).encode())
+        for name in self.input_files:
+            self.common.update(f'{name} {file_hash(os.path.join(input_dir, name))}\n'.encode())
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, run_dir):
+        h = self.common.copy()
+        h.update(file_hash(os.path.join(run_dir, input_filename)).encode())
+        return h.hexdigest()
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def outputs(self, run_dir):
+        skip = set(not_outputs + self.input_files)
+        return [f for f in os.listdir(run_dir)
+                if f not in skip and os.path.isfile(os.path.join(run_dir, f))]
+
+    # copy the cached outputs into run_dir. Returns True on a cache hit.
+    def fetch(self, run_dir):
+        key = self.key(run_dir)
+        entry = self.entry(key)
+        if not os.path.isdir(entry):
+            return False
+        for name in os.listdir(entry):
+            if name == 'meta.json':
+                continue
+            dst = os.path.join(run_dir, name)
+            if os.path.lexists(dst):
+                os.remove(dst)
+            shutil.copy2(os.path.join(entry, name), dst)
+        runcheck.write_status(run_dir, {'status': runcheck.OK, 'message': f'cached {key}',
+                                        'attempts': 0, 'returncode': 0, 'cached': key})
+        return True
+
+    # store the outputs of a completed run
+    def store(self, run_dir):
+        key = self.key(run_dir)
+        entry = self.entry(key)
+        if os.path.isdir(entry):
+            return False
+        # fill a temporary directory, then rename, so that a partial entry is never seen
+        tmp = f'{entry}.tmp{os.getpid()}'
+        os.makedirs(tmp)
+        for name in self.outputs(run_dir):
+            shutil.copy2(os.path.join(run_dir, name), os.path.join(tmp, name))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'run_dir': os.path.abspath(run_dir), 'time': time.time()}, f, indent=2)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp)  # stored by someone else in the meantime
+            return False
+        return True
+
+
+def run_dirs(campaign_dir):
+    return layout.run_dirs(campaign_dir)
+
+
+# before running: copy cached results into the runs that have not completed.
+# these runs are then marked ok, and not run again.
+def fetch_campaign(cache, campaign_dir):
+    hits = 0
+    for d in run_dirs(campaign_dir):
+        status = runcheck.read_status(d)
+        if status and status['status'] == runcheck.OK:
+            continue
+        if cache.fetch(d):
+            hits += 1
+    print(f'Result cache: {hits} runs found in {cache.cache_dir}')
+    return hits
+
+
+# after running: store the outputs of all completed runs
+def store_campaign(cache, campaign_dir):
+    stored = 0
+    for d in run_dirs(campaign_dir):
+        status = runcheck.read_status(d)
+        if status and status['status'] == runcheck.OK and 'cached' not in status:
+            stored += cache.store(d)
+    print(f'Result cache: {stored} runs stored in {cache.cache_dir}')
+    return stored
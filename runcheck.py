@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# Checking and retrying of DALES runs.
+#
+# Run in a run directory, wrapping the model command:
+#   python3 runcheck.py --retries 2 --backoff 60 -- mpirun -np 16 dales4 namoptions.001
+# runs the model with output to output.txt, checks the outputs and retries failed
+# runs. The outcome is recorded in status.json in the run directory. A run that
+# has already completed (status ok or no_walltime) is never executed again.
+#
+#   python3 runcheck.py --check <campaign_dir>
+# only checks the run directories of a campaign, e.g. after fetching results,
+# and writes the status table run_status.csv in the campaign directory.
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+import subprocess
+import layout
+
+input_filename = 'namoptions.001'
+output_txt = 'output.txt'
+status_file = 'status.json'
+status_table = 'run_status.csv'
+required_outputs = ['tmser.001.nc', 'profiles.001.nc']
+
+# failure classes. Runs that crashed or stopped early are worth retrying,
+# a missing walltime line does not make the other results invalid.
+OK = 'ok'
+NONZERO_EXIT = 'nonzero_exit'
+MISSING_OUTPUT = 'missing_output'
+TRUNCATED = 'truncated'
+NO_WALLTIME = 'no_walltime'
+retryable = [NONZERO_EXIT, MISSING_OUTPUT, TRUNCATED]
+usable = [OK, NO_WALLTIME]
+
+
+# read a numeric value from a Fortran namelist file, None if not found
+def namelist_value(filename, name):
+    with open(filename) as f:
+        for line in f:
+            m = re.match(r'\s*%s\s*=\s*([-+.\deE]+)' % name, line, re.IGNORECASE)
+            if m:
+                return float(m.group(1))
+    return None
+
+
+# wall clock time from the last line of the model output, None if not found
+def get_walltime(filename):
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 1024, 0))
+            t = f.read().splitlines()[-1]
+        return float(t.split(b'=')[-1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# classify the outcome of a run. Returns (status, message)
+def check_run(run_dir, returncode=None):
+    if returncode:
+        return NONZERO_EXIT, f'exit code {returncode}'
+
+    missing = [f for f in required_outputs
+               if not os.path.exists(os.path.join(run_dir, f)) and not layout.is_packed(run_dir, f)]
+    if missing:
+        return MISSING_OUTPUT, 'missing ' + ' '.join(missing)
+
+    runtime = namelist_value(os.path.join(run_dir, input_filename), 'runtime')
+    try:
+        with layout.open_dataset(run_dir, 'tmser.001.nc') as d:
+            time = d.variables['time'][:]
+    except (OSError, KeyError) as e:
+        return MISSING_OUTPUT, f'unreadable tmser.001.nc: {e}'
+    if len(time) < 2:
+        return TRUNCATED, f'{len(time)} time steps in tmser.001.nc'
+    if runtime is not None:
+        # allow up to two output intervals between the last output and the end
+        tol = 2 * (time[-1] - time[-2])
+        if time[-1] < runtime - tol:
+            return TRUNCATED, f'time series ends at {time[-1]:.0f} s of {runtime:.0f} s'
+
+    if get_walltime(os.path.join(run_dir, output_txt)) is None:
+        return NO_WALLTIME, f'no walltime line in {output_txt}'
+    return OK, ''
+
+
+def read_status(run_dir):
+    try:
+        with open(os.path.join(run_dir, status_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_status(run_dir, status):
+    tmp = os.path.join(run_dir, status_file + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp, os.path.join(run_dir, status_file))
+
+
+# run the model command in run_dir, check the result, and retry failed runs
+# up to retries times, waiting backoff * 2**(attempt-1) seconds in between.
+# Returns the final status dictionary.
+def run_with_retries(run_dir, command, retries=2, backoff=60):
+    status = read_status(run_dir)
+    if status and status['status'] in usable:
+        print(f'{run_dir}: already completed ({status["status"]}), not running again')
+        return status
+
+    status = {'status': None, 'attempts': 0, 'history': []}
+    while True:
+        status['attempts'] += 1
+        t0 = time.time()
+        with open(os.path.join(run_dir, output_txt), 'wb') as out:
+            returncode = subprocess.call(command, shell=True, cwd=run_dir, stdout=out)
+        result, message = check_run(run_dir, returncode)
+        status.update(status=result, message=message, returncode=returncode)
+        status['history'].append({'status': result, 'message': message,
+                                  'returncode': returncode, 'seconds': time.time() - t0})
+        write_status(run_dir, status)
+        if result not in retryable or status['attempts'] > retries:
+            break
+        wait = backoff * 2**(status['attempts'] - 1)
+        print(f'{run_dir}: {result} ({message}), retrying in {wait:.0f} s')
+        time.sleep(wait)
+    if result != OK:
+        print(f'{run_dir}: {result} ({message}) after {status["attempts"]} attempts')
+    return status
+
+
+# shell command running the model through this script, for use in a run directory
+def wrap_command(model_cmd, retries=2, backoff=60):
+    script = os.path.abspath(__file__)
+    return f"python3 {script} --retries {retries} --backoff {backoff} -- {model_cmd}"
+
+
+def run_dirs(campaign_dir):
+    return layout.run_dirs(campaign_dir)
+
+
+# status of every run in a campaign. Runs without a status file, e.g. runs done
+# with FabSim, are checked from their outputs. A failed status from an earlier check
+# (attempts 0) is checked again, the results may have been fetched since.
+def collect_status(campaign_dir):
+    table = {}
+    for d in run_dirs(campaign_dir):
+        status = read_status(d)
+        if status is None or (status.get('attempts') == 0 and status['status'] not in usable):
+            result, message = check_run(d)
+            status = {'status': result, 'message': message, 'attempts': 0, 'returncode': None}
+            write_status(d, status)
+        table[os.path.basename(d)] = status
+    return table
+
+
+def write_status_table(campaign_dir):
+    table = collect_status(campaign_dir)
+    with open(os.path.join(campaign_dir, status_table), 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['run', 'status', 'attempts', 'returncode', 'message'])
+        for run, s in table.items():
+            w.writerow([run, s['status'], s.get('attempts'), s.get('returncode'), s.get('message', '')])
+    return table
+
+
+def read_status_table(campaign_dir):
+    with open(os.path.join(campaign_dir, status_table), newline='') as f:
+        return {row['run']: row for row in csv.DictReader(f)}
+
+
+def failed_runs(table):
+    return {run: s for run, s in table.items() if s['status'] not in usable}
+
+
+def print_summary(table):
+    counts = {}
+    for s in table.values():
+        counts[s['status']] = counts.get(s['status'], 0) + 1
+    print('Run status:', ', '.join(f'{k}: {v}' for k, v in sorted(counts.items())))
+    for run, s in table.items():
+        if s['status'] != OK:
+            print(f"  {run:>10} {s['status']:>15}  {s.get('message', '')}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run and check a DALES run")
+    parser.add_argument("--retries", type=int, default=2, help="Number of retries for failed runs")
+    parser.add_argument("--backoff", type=float, default=60, help="Wait before the first retry, in seconds")
+    parser.add_argument("--check", default=None, metavar="CAMPAIGN_DIR",
+                        help="Only check the runs of a campaign and write the status table")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="model command")
+    args = parser.parse_args()
+
+    if args.check:
+        print_summary(write_status_table(args.check))
+        sys.exit()
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    status = run_with_retries(os.getcwd(), ' '.join(command), args.retries, args.backoff)
+    sys.exit(0 if status['status'] in usable else 1)
@@ -0,0 +1,140 @@
+# Morris screening: elementary effects of all parameters of a template.
+#
+# A cheap first campaign, before an SC campaign over a few parameters. Each of the
+# r trajectories starts at a random point of a grid with p levels in the unit cube,
+# and changes one parameter at a time by delta = p / (2 (p-1)), in random order.
+# The elementary effect of parameter i in a trajectory is
+#   EE_i = (Y(x + delta e_i) - Y(x)) / (+-delta)
+# and the parameters are ranked by mu* = mean |EE_i| (Campolongo et al. 2007),
+# relative to the standard deviation of the QoI over all runs, taking the largest
+# over the QoIs. sigma, the standard deviation of EE_i, indicates non-linearity
+# and interactions. Ranges are the min and max of the parameter definitions.
+
+import re
+import json
+import numpy
+import chaospy as cp
+
+# parameters that are not physical or numerical choices, or that do not change the results
+skip_params = ('seed', 'fidelity', 'qmc_point', 'qmc_matrix', 'morris_trajectory', 'morris_step',
+               'nprocx', 'nprocy')
+
+
+# names of the parameters used in a template
+def template_params(params, template):
+    with open(template) as f:
+        text = ' '.join(re.findall(r'{{(.*?)}}', f.read()))
+    return [p for p in params if p not in skip_params and re.search(r'\b%s\b' % p, text)]
+
+
+# parameters with a few integer values are choices (schemes, flags)
+def is_discrete(param):
+    lo, hi = param['min'], param['max']
+    return float(lo).is_integer() and float(hi).is_integer() and hi - lo <= 2
+
+
+def distributions(params, names):
+    vary = {}
+    for p in names:
+        if is_discrete(params[p]):
+            vary[p] = cp.DiscreteUniform(int(params[p]['min']), int(params[p]['max']))
+        else:
+            vary[p] = cp.Uniform(params[p]['min'], params[p]['max'])
+    return vary
+
+
+# run parameter dictionaries for r trajectories over the parameters names.
+# morris_trajectory is the index of the trajectory, morris_step 0 for its start, k for the k-th change
+def design(params, names, trajectories=10, levels=4, seed=None):
+    rng = numpy.random.default_rng(seed)
+    P = len(names)
+    delta = levels / (2 * (levels - 1))
+    runs = []
+    for t in range(trajectories):
+        # start on the grid, in the part from which +delta stays in the cube
+        x = rng.integers(0, levels // 2, size=P) / (levels - 1)
+        sign = rng.choice([-1, 1], size=P)
+        x = numpy.where(sign < 0, x + delta, x)
+        points = [x.copy()]
+        for i in rng.permutation(P):
+            x[i] += sign[i] * delta
+            points.append(x.copy())
+        for k, u in enumerate(points):
+            run = {}
+            for p, ui in zip(names, u):
+                lo, hi = params[p]['min'], params[p]['max']
+                run[p] = float(round(lo + ui * (hi - lo)) if is_discrete(params[p]) else lo + ui * (hi - lo))
+            run['morris_trajectory'] = t
+            run['morris_step'] = k
+            runs.append(run)
+    return runs
+
+
+# elementary effects, (trajectories, QoIs, params), from the collated runs.
+# the parameter changed in each step is found from the parameter values.
+def elementary_effects(data, qois, params, names):
+    lo = numpy.array([params[p]['min'] for p in names])
+    width = numpy.array([params[p]['max'] - params[p]['min'] for p in names])
+    trajectories = numpy.unique(data['morris_trajectory'].values.astype(int))
+    EE = numpy.full((len(trajectories), len(qois), len(names)), numpy.nan)
+    for n, t in enumerate(trajectories):
+        run = data[data['morris_trajectory'] == t].sort_values('morris_step')
+        U = (run[names].values.astype(float) - lo) / width
+        Y = run[qois].values.astype(float)
+        for k in range(1, len(run)):
+            du = U[k] - U[k - 1]
+            i = numpy.argmax(numpy.abs(du))
+            if du[i] != 0:
+                EE[n, :, i] = (Y[k] - Y[k - 1]) / du[i]
+    return EE
+
+
+# mu*, sigma (QoIs, params), and the score of each parameter: the largest mu* over the QoIs,
+# relative to the standard deviation of the QoI
+def statistics(data, qois, params, names):
+    EE = elementary_effects(data, qois, params, names)
+    mu_star = numpy.nanmean(numpy.abs(EE), axis=0)
+    sigma = numpy.nanstd(EE, axis=0)
+    std = data[qois].values.astype(float).std(axis=0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        score = numpy.nanmax(mu_star / std[:, None], axis=0)
+    return mu_star, sigma, numpy.nan_to_num(score)
+
+
+# influential parameters and their SC orders, from the scores: parameters scoring below
+# threshold times the largest score are left out, orders 1-3 follow the score,
+# at most the number of values - 1 for discrete parameters
+def recommend(params, names, score, threshold=0.1, max_order=3):
+    top = score.max() if len(score) else 0
+    chosen = []
+    for i in numpy.argsort(-score):
+        if top <= 0 or score[i] < threshold * top:
+            break
+        p = names[i]
+        order = int(numpy.clip(numpy.ceil(max_order * score[i] / top), 1, max_order))
+        if is_discrete(params[p]):
+            order = min(order, int(params[p]['max'] - params[p]['min']))
+        chosen.append((p, order))
+    return chosen
+
+
+# write a screened experiment: the recommended parameters with their ranges and orders,
+# and a seed dimension as in the hand-made experiments. Used as --experiment <file>.json
+def save_experiment(filename, params, chosen, seed_order=2):
+    vary = {}
+    for p, order in chosen:
+        kind = 'DiscreteUniform' if is_discrete(params[p]) else 'Uniform'
+        vary[p] = [kind, params[p]['min'], params[p]['max'], order]
+    vary['seed'] = ['DiscreteUniform', 1, 2000, seed_order]
+    with open(filename, 'w') as f:
+        json.dump({'vary': vary}, f, indent=2)
+
+
+# vary dictionary and orders of a screened experiment
+def load_experiment(filename):
+    with open(filename) as f:
+        spec = json.load(f)['vary']
+    vary = {}
+    for p, (kind, lo, hi, order) in spec.items():
+        vary[p] = cp.DiscreteUniform(int(lo), int(hi)) if kind == 'DiscreteUniform' else cp.Uniform(lo, hi)
+    return vary, tuple(spec[p][3] for p in spec)
@@ -0,0 +1,116 @@
+# Variance-based sensitivity analysis on a tensor grid, split over worker processes.
+#
+# On a tensor-product grid with quadrature weights w, the conditional mean
+# E[Y | X_u] for a subset u of the parameters is the weighted average over the
+# runs sharing the same values of X_u. The closed variance Var(E[Y | X_u]) then
+# gives the Sobol indices:
+#   first order    S_i  = Var(E[Y | X_i]) / Var(Y)
+#   total          ST_i = 1 - Var(E[Y | X_~i]) / Var(Y)
+#   interaction    S_u  = sum over v in u of (-1)^(|u|-|v|) Var(E[Y | X_v]) / Var(Y)
+# Only the requested indices are computed. The QoIs are split over a process
+# pool, each worker handling its QoIs together as matrix operations. The results
+# have the structure of the EasyVVUQ SC analysis results.
+
+import itertools
+import numpy
+import concurrent.futures
+
+
+# closed variance Var(E[Y | X_u]) for all columns of Y. u: tuple of parameter indices
+def closed_variance(w, Y, X, u, mean):
+    if len(u) == 0:
+        return numpy.zeros(Y.shape[1])
+    inverse = numpy.unique(X[:, list(u)], axis=0, return_inverse=True)[1].ravel()
+    G = numpy.zeros((len(X), inverse.max() + 1))   # indicator of the group of each run
+    G[numpy.arange(len(X)), inverse] = 1
+    p = w @ G                                      # weight of each group
+    cond_mean = ((G * w[:, None]).T @ Y) / p[:, None]
+    return p @ (cond_mean - mean)**2
+
+
+# requested indices for the QoIs in the columns of Y.
+# requested: list of 'first', 'total' and interaction tuples of parameter indices
+def analyse_block(w, Y, X, requested):
+    mean = w @ Y
+    var = w @ (Y - mean)**2
+    P = X.shape[1]
+    closed = {}
+    def V(u):
+        u = tuple(sorted(u))
+        if u not in closed:
+            closed[u] = closed_variance(w, Y, X, u, mean)
+        return closed[u]
+
+    out = {'mean': mean, 'var': var}
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        if 'first' in requested:
+            out['first'] = numpy.stack([V((i,)) / var for i in range(P)], axis=1)
+        if 'total' in requested:
+            out['total'] = numpy.stack([1 - V(tuple(j for j in range(P) if j != i)) / var
+                                        for i in range(P)], axis=1)
+        out['interactions'] = {}
+        for u in requested:
+            if isinstance(u, tuple):
+                Su = 0
+                for k in range(1, len(u) + 1):
+                    for v in itertools.combinations(u, k):
+                        Su = Su + (-1)**(len(u) - k) * V(v)
+                out['interactions'][u] = Su / var
+    return out
+
+
+# split the QoIs over workers processes, and merge the results into the structure
+# of the EasyVVUQ analysis: results['statistical_moments'][qoi]['mean'], ...
+# results['sobols_first'][qoi][param], results['sobols_total'][qoi][param],
+# results['sobols'][qoi][(i, j)] for the interactions (parameter indices in vary order)
+def analyse(data, qois, vary, weights, requested=('first',), workers=1):
+    var = list(vary)
+    X = data[var].values.astype(float)
+    Y = data[qois].values.astype(float)
+    w = numpy.asarray(weights, dtype=float)
+    w = w / w.sum()
+
+    blocks = [b for b in numpy.array_split(numpy.arange(len(qois)), max(1, min(workers, len(qois)))) if len(b)]
+    if len(blocks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(blocks)) as pool:
+            parts = list(pool.map(analyse_block, [w] * len(blocks), [Y[:, b] for b in blocks],
+                                  [X] * len(blocks), [list(requested)] * len(blocks)))
+    else:
+        parts = [analyse_block(w, Y, X, list(requested))]
+
+    results = {'statistical_moments': {}, 'sobols_first': {}, 'sobols_total': {}, 'sobols': {}}
+    for b, part in zip(blocks, parts):
+        for j, qi in enumerate(b):
+            qoi = qois[qi]
+            results['statistical_moments'][qoi] = {'mean': part['mean'][j], 'var': part['var'][j],
+                                                   'std': numpy.sqrt(part['var'][j])}
+            if 'first' in part:
+                results['sobols_first'][qoi] = {v: part['first'][j, i] for i, v in enumerate(var)}
+            if 'total' in part:
+                results['sobols_total'][qoi] = {v: part['total'][j, i] for i, v in enumerate(var)}
+            sobols = {}
+            if 'first' in part:
+                sobols.update({(i,): numpy.array([part['first'][j, i]]) for i in range(len(var))})
+            sobols.update({u: numpy.array([S[j]]) for u, S in part['interactions'].items()})
+            results['sobols'][qoi] = sobols
+    return results
+
+
+# parse a list of requested indices, e.g. "first,total,Nc_0:seed"
+# interactions are given as parameter names joined with ':'
+def parse_requested(text, vary):
+    var = list(vary)
+    requested = ['first']   # always, for the table of first-order indices
+    for item in text.split(','):
+        item = item.strip()
+        if item == 'first':
+            continue
+        elif item == 'total':
+            requested.append(item)
+        elif item == 'all':
+            # all interactions, as in the EasyVVUQ SC analysis
+            for k in range(2, len(var) + 1):
+                requested.extend(itertools.combinations(range(len(var)), k))
+        else:
+            requested.append(tuple(sorted(var.index(v) for v in item.split(':'))))
+    return requested
@@ -0,0 +1,96 @@
+# Time-resolved UQ: moments and Sobol indices at every output time of tmser.001.nc.
+#
+# postproc.py reduces each time series to an average over a window, which hides how
+# the sensitivities change during the spin-up and the transition to a steady state.
+# Here the time series of all runs are interpolated to a common time axis, the output
+# times of the longest run up to the end of the shortest one, and stacked into one
+# (runs, times * QoIs) array. The moments and first-order Sobol indices of all times
+# and QoIs are then one call of the tensor-grid analysis in sobol.py, i.e. a few matrix
+# products, so thousands of time steps of hundreds of runs take seconds.
+
+import numpy
+import concurrent.futures
+import matplotlib.pyplot as plt
+import layout
+import sobol
+from postproc import default_spec
+
+tmser_file = 'tmser.001.nc'
+results_file = 'time_resolved.npz'
+
+
+def read_run(run_dir, variables):
+    with layout.open_dataset(run_dir, tmser_file) as d:
+        t = numpy.asarray(d.variables['time'][:], dtype=float)
+        Y = numpy.stack([numpy.ma.filled(numpy.ma.asarray(d.variables[v][:], dtype=float), numpy.nan)
+                         for v in variables], axis=1)
+    return t, Y
+
+
+# time series of all runs on a common time axis. qois: {QoI name: tmser variable}
+# returns t (times,), Y (runs, times, QoIs)
+def load(run_dirs, qois=None, workers=8):
+    qois = qois or default_spec['timeseries']
+    # worker processes, the netCDF library is not thread-safe
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(read_run, run_dirs, [list(qois.values())] * len(run_dirs),
+                              chunksize=max(len(run_dirs) // (4 * workers), 1)))
+    longest = max(parts, key=lambda p: len(p[0]))[0]
+    t = longest[longest <= min(p[0][-1] for p in parts)]
+    Y = numpy.empty((len(parts), len(t), len(qois)))
+    for r, (tr, Yr) in enumerate(parts):
+        if len(tr) == len(t) and numpy.array_equal(tr, t):
+            Y[r] = Yr
+        else:
+            for q in range(len(qois)):
+                Y[r, :, q] = numpy.interp(t, tr, Yr[:, q])
+    return t, Y
+
+
+# moments and first-order Sobol indices at every time.
+# X: (runs, params) parameter values, w: quadrature weights of the runs, names: parameter names
+# returns {'time', 'qois', 'params', 'mean' (times, QoIs), 'std', 'first' (times, QoIs, params)}
+def analyse(t, Y, X, w, qois, names):
+    R, T, Q = Y.shape
+    out = sobol.analyse_block(w / w.sum(), Y.reshape(R, T * Q), X, ['first'])
+    return {'time': t, 'qois': list(qois), 'params': list(names),
+            'mean': out['mean'].reshape(T, Q), 'std': numpy.sqrt(out['var']).reshape(T, Q),
+            'first': out['first'].reshape(T, Q, len(names))}
+
+
+def save(filename, results):
+    numpy.savez(filename, **results)
+
+
+def load_results(filename):
+    with numpy.load(filename) as f:
+        results = {k: f[k] for k in f.files}
+    results['qois'] = [str(q) for q in results['qois']]
+    results['params'] = [str(p) for p in results['params']]
+    return results
+
+
+# per QoI, the mean +- std against time, and the first-order Sobol indices against time
+def plot(results, filename, labels={}, scale={}):
+    qois, names = results['qois'], results['params']
+    hours = results['time'] / 3600
+    fig, ax = plt.subplots(nrows=len(qois), ncols=2, sharex=True, squeeze=False,
+                           figsize=(7, 1.4 * len(qois)), dpi=200)
+    for j, q in enumerate(qois):
+        s = scale.get(q, 1)
+        m, sd = results['mean'][:, j] * s, results['std'][:, j] * s
+        ax[j][0].fill_between(hours, m - sd, m + sd, color='#ff8000', alpha=.3, lw=0)
+        ax[j][0].plot(hours, m, color='#ff8000', lw=.8)
+        ax[j][0].set_ylabel(labels.get(q, q), rotation=0)
+        for i, p in enumerate(names):
+            ax[j][1].plot(hours, results['first'][:, j, i], lw=.8, label=labels.get(p, p))
+        ax[j][1].set_ylim(0, 1)
+    ax[0][1].legend(fontsize=5, ncol=len(names), loc='upper left', frameon=False)
+    ax[0][0].set_title('mean $\\pm$ std', fontsize=7)
+    ax[0][1].set_title('first-order Sobol index', fontsize=7)
+    ax[-1][0].set_xlabel('time (h)')
+    ax[-1][1].set_xlabel('time (h)')
+    plt.tight_layout()
+    print('Saving time-resolved plot as', filename)
+    plt.savefig(filename)
+    plt.close(fig)
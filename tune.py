@@ -0,0 +1,107 @@
+# Choice of the MPI decomposition and the number of concurrent runs for a campaign.
+#
+# For ensembles, the number of samples per hour matters, not the speed of one run.
+# For each number of MPI tasks n, the most square decomposition nprocx x nprocy
+# of itot x jtot is benchmarked by running cores // n short copies of the case at
+# the same time, as they would run in the campaign. The throughput is
+#   copies * runtime / walltime    (simulated hours per hour)
+# and the decomposition with the largest throughput is chosen. The choice is saved
+# to a JSON file, and put into the namelists when the campaign is prepared.
+
+import os
+import json
+import time
+import shutil
+import subprocess
+import numpy
+import jinja2
+import fidelity
+
+input_filename = 'namoptions.001'
+
+
+# all nprocx, nprocy that divide itot, jtot, with at most cores tasks
+def decompositions(itot, jtot, cores):
+    return [(px, py) for px in range(1, itot + 1) if itot % px == 0
+            for py in range(1, jtot + 1) if jtot % py == 0 and px * py <= cores]
+
+
+# for each number of tasks, the decomposition closest to square, if the concurrent
+# runs with that many tasks keep at least half of the cores busy
+def candidates(itot, jtot, cores):
+    best = {}
+    for px, py in decompositions(itot, jtot, cores):
+        n = px * py
+        if (cores // n) * n < cores / 2:
+            continue
+        if n not in best or abs(numpy.log(px / py)) < abs(numpy.log(best[n][0] / best[n][1])):
+            best[n] = (px, py)
+    return [best[n] for n in sorted(best)]
+
+
+# namelist text of the case, from the template with the default parameter values
+def render(template, params):
+    with open(template) as f:
+        text = f.read()
+    return jinja2.Template(text).render(**{k: p['default'] for k, p in params.items()})
+
+
+# a run directory for a benchmark, with the input files and a short runtime
+def setup_run(run_dir, text, input_dir, px, py, runtime):
+    os.makedirs(run_dir, exist_ok=True)
+    for f in os.listdir(input_dir):
+        shutil.copy(os.path.join(input_dir, f), run_dir)
+    for name, value in (('nprocx', px), ('nprocy', py), ('runtime', runtime)):
+        text = fidelity.set_value(text, name, value)
+    with open(os.path.join(run_dir, input_filename), 'w') as f:
+        f.write(text)
+
+
+# walltime of copies concurrent runs with decomposition px x py, or None if any failed
+def benchmark(work_dir, text, input_dir, command, px, py, copies, runtime):
+    dirs = [os.path.join(work_dir, f'{px}x{py}', f'run{i}') for i in range(copies)]
+    for d in dirs:
+        setup_run(d, text, input_dir, px, py, runtime)
+    cmd = command.replace('{np}', str(px * py))
+    start = time.time()
+    procs = []
+    for d in dirs:
+        with open(os.path.join(d, 'output.txt'), 'wb') as out:
+            procs.append(subprocess.Popen(cmd, shell=True, cwd=d, stdout=out, stderr=subprocess.STDOUT))
+    codes = [p.wait() for p in procs]
+    wall = time.time() - start
+    return None if any(codes) else wall
+
+
+# benchmark the candidate decompositions, and choose the one with the largest throughput.
+# command: model command with {np} for the number of tasks, e.g. 'mpirun -np {np} dales4 namoptions.001'
+def tune(text, input_dir, command, cores, runtime=600, work_dir='tune'):
+    itot = int(fidelity.get_value(text, 'itot'))
+    jtot = int(fidelity.get_value(text, 'jtot'))
+    results = []
+    for px, py in candidates(itot, jtot, cores):
+        copies = cores // (px * py)
+        wall = benchmark(work_dir, text, input_dir, command, px, py, copies, runtime)
+        if wall is None:
+            print(f'{px:3d} x {py:3d}: failed, see {work_dir}/{px}x{py}')
+            continue
+        r = {'nprocx': px, 'nprocy': py, 'parallel': copies, 'walltime': wall,
+             'walltime_per_hour': wall / runtime * 3600, 'throughput': copies * runtime / wall}
+        print('%3d x %3d, %3d concurrent runs: %8.1f s per simulated hour, %6.2f simulated hours per hour' %
+              (px, py, copies, r['walltime_per_hour'], r['throughput']))
+        results.append(r)
+    if not results:
+        raise RuntimeError(f'all benchmark runs failed, see {work_dir}')
+    best = max(results, key=lambda r: r['throughput'])
+    return {'cores': cores, 'runtime': runtime, 'nprocx': best['nprocx'], 'nprocy': best['nprocy'],
+            'parallel': best['parallel'], 'benchmarks': results}
+
+
+def save(filename, tuning):
+    with open(filename, 'w') as f:
+        json.dump(tuning, f, indent=2)
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)